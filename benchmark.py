@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import timeit
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import ttt
+import ttt_player
+
+def bench(stmt, number, repeat=5):
+  '''Best time, in microseconds, of a single call to stmt.'''
+  return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number * 1e6
+
+def bench_each(make, f, number, repeat=5):
+  '''Best time, in microseconds, of a call to f on an object made by make(), the objects being made beforehand.'''
+  best = float('inf')
+  for idx in range(0, repeat):
+    xs = [make() for n in range(0, number)]
+    t = time.perf_counter()
+    for x in xs: f(x)
+    best = min(best, time.perf_counter() - t)
+  return best / number * 1e6
+
+def measure(f, setup=lambda: None):
+  '''Return (seconds, peak MiB allocated) of a call to f.
+Time and memory are measured on separate calls, both preceded by a call to setup.'''
+  setup()
+  t = time.perf_counter()
+  f()
+  t = time.perf_counter() - t
+  setup()
+  tracemalloc.start()
+  f()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return t, peak / 2**20
+
+def positions(step=50):
+  '''Boards where a move is to be made: the empty board and a sample of the reachable ones.'''
+  bs = [b for b in ttt.Board().get_descendants() if not b.is_over()]
+  return [ttt.Board()] + bs[1::step]
+
+def relabel(b, p1, p2):
+  '''Board b with marks p1 and p2 instead of its own.'''
+  marks = {b.e : b.e, b.p1 : p1, b.p2 : p2}
+  return ttt.Board(tuple(tuple(marks[el] for el in r) for r in b.b), b.e, p1, p2, b.it)
+
+# Every benchmark returns a list of (name, unit, value); lower values are better, except for rates (units ending in /s)
+
+def board_micro(cls):
+  '''Time the board primitives used by the players on board class cls.'''
+  empty = cls()
+  mid = cls().play(1,1).play(0,0).play(2,2)
+  name = cls.__name__
+  return [
+    (name + '.play', 'us', bench(lambda: mid.play(0,1), 20000)),
+    (name + '.get_children', 'us', bench(lambda: mid.get_children(), 5000)),
+    (name + '.get_descendants', 'us', bench(lambda: empty.get_descendants(), 3)),
+    # Win check and hash of a new board: boards made by play() know their winner, and cache their hash
+    (name + '.who_won', 'us', bench_each(lambda: cls(mid.b, it=3), cls.who_won, 20000)),
+    (name + '.__hash__', 'us', bench_each(lambda: cls(mid.b, it=3), hash, 20000)),
+  ]
+
+def board_pool():
+  '''Time and memory of tree walks with and without interning boards.'''
+  res = []
+  Board_pool = ttt.Board.pool
+  for pool in (None, ttt.BoardPool()):
+    ttt.Board.pool = pool
+    suffix = ' (pool)' if pool != None else ''
+    setup = lambda: pool.clear() if pool != None else None
+    try:
+      t, mem = measure(lambda: ttt.Board().get_descendants(), setup)
+      res += [('get_descendants time' + suffix, 's', t), ('get_descendants memory' + suffix, 'MiB', mem)]
+      t, mem = measure(lambda: ttt_player.DRPlayer(ttt.Board.default_p1).play(ttt.Board()),
+                       lambda: (setup(), ttt_player.DRPlayer.cache.clear()))
+      res += [('DRPlayer warm-up time' + suffix, 's', t), ('DRPlayer warm-up memory' + suffix, 'MiB', mem)]
+    finally:
+      ttt.Board.pool = Board_pool
+  return res
+
+def traversal():
+  '''Time and peak memory of walks over the boards reachable from the empty board.'''
+  def walk(**kwargs):
+    for b in ttt.Board().iter_descendants(**kwargs): pass
+  res = []
+  for name, f in (('get_descendants', lambda: ttt.Board().get_descendants()),
+                  ('iter_descendants', walk),
+                  ('iter_descendants (visited=False)', lambda: walk(visited=False))):
+    t, mem = measure(f)
+    res += [(name + ' time', 's', t), (name + ' memory', 'MiB', mem)]
+  return res
+
+def enumeration(m=3, n=4, k=3):
+  '''Time per board of Board.enum_confs() on an m x n board, in this process and on every CPU.'''
+  res = []
+  for workers in sorted({1, os.cpu_count()}):
+    t = time.perf_counter()
+    codes = ttt.MNKBoard.enum_confs(workers, m=m, n=n, k=k)
+    t = time.perf_counter() - t
+    res.append(('enum_confs %d,%d,%d board (%d workers)' % (m, n, k, workers), 'us', t / len(codes) * 1e6))
+  return res
+
+def move_latency(name, make_player, bs, clear=lambda: None, warm=False):
+  '''Mean time, in microseconds, of a move by the player made by make_player, over the boards in bs.
+Caches are cleared by clear() before every move.  If warm is true, every board is played once beforehand, so
+that the shared caches are filled.'''
+  if warm:
+    for b in bs: make_player(b.next_player()).play(b)
+  t = 0.0
+  for b in bs:
+    clear()
+    p = make_player(b.next_player())
+    start = time.perf_counter()
+    p.play(b)
+    t += time.perf_counter() - start
+  return (name + ' move', 'us', t / len(bs) * 1e6)
+
+def player_latency():
+  bs = positions()
+  ttt_player.solved_db(build=True, save=False) # Looked up by APlayer; built in memory if missing
+  random.seed(0)
+  cold = lambda: (ttt_player.DRPlayer.cache.clear(), ttt.Board.outcomes.clear())
+  res = [
+    move_latency('APlayer', ttt_player.APlayer, bs),
+    move_latency('APlayer (no database)', ttt_player.APlayer,
+                 [relabel(b, 'a', 'b') for b in bs], ttt.Board.outcomes.clear),
+    move_latency('DPlayer', ttt_player.DPlayer, bs),
+    move_latency('ADPlayer', ttt_player.ADPlayer, bs),
+    move_latency('DRPlayer (cold)', ttt_player.DRPlayer, bs, cold),
+    move_latency('DRPlayer (warm)', ttt_player.DRPlayer, bs, warm=True),
+    move_latency('RLPlayer', ttt_player.RLPlayer, bs),
+    move_latency('NegamaxPlayer (cold)', ttt_player.NegamaxPlayer, bs, ttt_player.NegamaxPlayer.table.clear),
+    move_latency('NegamaxPlayer (warm)', ttt_player.NegamaxPlayer, bs, warm=True),
+    move_latency('MCTSPlayer', ttt_player.MCTSPlayer, bs),
+  ]
+  # First move of the game, when the caches are cold
+  for cls, clear in ((ttt_player.DRPlayer, cold), (ttt_player.NegamaxPlayer, ttt_player.NegamaxPlayer.table.clear)):
+    res.append(move_latency(cls.__name__ + ' first', cls, [ttt.Board()] * 3, clear))
+  # First move of a player starting from rewards saved to a file
+  with tempfile.TemporaryDirectory() as d:
+    path = os.path.join(d, 'rewards')
+    ttt_player.DRPlayer(ttt.Board.default_p1).save(path)
+    def from_file(p):
+      pl = ttt_player.DRPlayer(p)
+      pl.load(path)
+      return pl
+    res.append(move_latency('DRPlayer (from file) first', from_file, [ttt.Board()] * 3, cold))
+  # Moves looked up in compiled tables (compiled once, outside the measurement)
+  for p in (ttt.Board.default_p1, ttt.Board.default_p2):
+    ttt_player.compile_player(ttt_player.NegamaxPlayer(p), verify=False)
+  res.append(move_latency('TablePlayer (NegamaxPlayer)',
+                          lambda p: ttt_player.compile_player(ttt_player.NegamaxPlayer(p), verify=False), bs))
+  return res
+
+def game_throughput(games=1000, warmup=100):
+  '''Games per second of Game.start, and of GamePool.start, between pairs of players, after warmup games to fill the caches.
+Every player faces a DPlayer, whose random moves make the games differ.'''
+  pairs = ((ttt_player.DPlayer, ttt_player.DPlayer),
+           (ttt_player.ADPlayer, ttt_player.DPlayer),
+           (ttt_player.DRPlayer, ttt_player.DPlayer),
+           (ttt_player.RLPlayer, ttt_player.DPlayer),
+           (ttt_player.NegamaxPlayer, ttt_player.DPlayer))
+  res = []
+  random.seed(0)
+  for c1, c2 in pairs:
+    p1, p2 = c1(ttt.Board.default_p1), c2(ttt.Board.default_p2)
+    for idx in range(0, warmup):
+      ttt.Game(p1, p2).start()
+    t = time.perf_counter()
+    for idx in range(0, games):
+      ttt.Game(p1, p2).start()
+    t = time.perf_counter() - t
+    res.append(('Game %s vs %s' % (c1.__name__, c2.__name__), 'games/s', games / t))
+    # As many games, played together, with their moves asked for in batches
+    p1, p2 = c1(ttt.Board.default_p1), c2(ttt.Board.default_p2)
+    ttt.GamePool(p1, p2, warmup).start()
+    t = time.perf_counter()
+    ttt.GamePool(p1, p2, games).start()
+    t = time.perf_counter() - t
+    res.append(('GamePool %s vs %s' % (c1.__name__, c2.__name__), 'games/s', games / t))
+  return res
+
+def midgame(m, n, k, seed=0):
+  '''An m,n,k board, a third full, won by nobody, reached by random moves.'''
+  rnd = random.Random(seed)
+  while True:
+    b = ttt.MNKBoard(m=m, n=n, k=k)
+    while not b.is_over() and b.it < m*n // 3:
+      b = b.play(rnd.choice(b.get_empty_idxs()))
+    if not b.is_over(): return b
+
+def mnk_scaling(sizes=((3,3,3), (4,4,3), (5,5,4), (7,7,5), (9,9,5), (15,15,5), (19,19,5))):
+  '''Time of a move on m,n,k boards of growing size: play() followed by the checks made by Game.start.
+The full scan, done for boards created from a configuration, is timed for comparison, and so is the move of a DPlayer.'''
+  res = []
+  for m,n,k in sizes:
+    b = midgame(m, n, k)
+    move = b.get_empty_idxs()[0]
+    name = 'MNKBoard %d,%d,%d' % (m, n, k)
+    res.append((name + ' move', 'us', bench(lambda: b.play(move).is_over(), 20000)))
+    res.append((name + ' full scan', 'us', bench(lambda: ttt.MNKBoard(b.b, k=k).who_won(), 200)))
+    p = ttt_player.DPlayer(b.next_player())
+    res.append((name + ' DPlayer move', 'us', bench(lambda: p.play(b), 200)))
+  return res
+
+suites = {
+  'board' : lambda: board_micro(ttt.Board) + board_micro(ttt.BitBoard),
+  'pool' : board_pool,
+  'traversal' : traversal,
+  'enum' : enumeration,
+  'players' : player_latency,
+  'games' : game_throughput,
+  'mnk' : mnk_scaling,
+}
+
+def compare(results, baseline, tolerance):
+  '''Print results next to baseline; return the names of the results that are worse by more than tolerance.
+The ratio is the slowdown: current over baseline, or baseline over current for rates.'''
+  regressions = []
+  print('%-45s %12s %12s %8s' % ('benchmark', 'baseline', 'current', 'ratio'))
+  for name in results:
+    value = results[name]['value']
+    if name not in baseline:
+      print('%-45s %12s %12.3f %8s' % (name, '-', value, ''))
+      continue
+    base = baseline[name]['value']
+    if results[name]['unit'].endswith('/s'): ratio = base / value if value > 0 else float('inf')
+    else: ratio = value / base if base > 0 else float('inf')
+    flag = ''
+    if ratio > 1 + tolerance:
+      flag = ' REGRESSION'
+      regressions.append(name)
+    print('%-45s %12.3f %12.3f %7.2fx%s' % (name, base, value, ratio, flag))
+  return regressions
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Benchmark boards, players and games.')
+  parser.add_argument('suites', nargs='*', default=list(suites), help='suites to run: %s' % ', '.join(suites))
+  parser.add_argument('--save', help='save the results as JSON to this file')
+  parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+  parser.add_argument('--tolerance', type=float, default=0.25,
+                      help='flag results slower than the baseline by more than this fraction (default 0.25)')
+  args = parser.parse_args(argv[1:])
+
+  results = {}
+  for suite in args.suites:
+    for name, unit, value in suites[suite]():
+      results[name] = {'suite' : suite, 'unit' : unit, 'value' : value}
+  if args.save != None:
+    with open(args.save, 'w') as f:
+      json.dump({'python' : platform.python_version(), 'machine' : platform.machine(),
+                 'results' : results}, f, indent=1)
+  if args.compare != None:
+    with open(args.compare) as f:
+      baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+      print('%d regression(s)' % len(regressions))
+      return 1
+  else:
+    for name in results:
+      print('%-45s %12.3f %s' % (name, results[name]['value'], results[name]['unit']))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
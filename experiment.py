@@ -1,48 +1,329 @@
 #!/usr/bin/env python3
 
+import io
+import os
 import sys
+import math
+import random
+import argparse
+import itertools
+import collections
+import concurrent.futures
 
 import ttt
+import ttt_log
 import ttt_player
 
+x = ttt.Board.default_p1
+o = ttt.Board.default_p2
+
+def make_player(spec):
+  '''Build a player from spec, a tuple (class, mark) or (class, mark, params).'''
+  if len(spec) == 2: return spec[0](spec[1])
+  return spec[0](spec[1], params=spec[2])
+
+def play_games(job):
+  '''Play a chunk of games between the players of one config.
+job is a tuple (config index, config, number of games, seed, stats, log), where config is a pair of player specs.
+Return the config index, the tally of winners, the ttt.Stats recorded if stats is true (None otherwise),
+and the games as ttt_log records if log is true (None otherwise).
+The players draw from the random module, seeded from seed; its state is restored afterwards, so that playing
+in the caller's process does not change the caller's random numbers.'''
+  idx, config, games, seed, stats, log = job
+  if stats:
+    outer = ttt.stats # Statistics the caller may be recording, when playing in the caller's process
+    ttt.enable_stats()
+  state = random.getstate()
+  random.seed(seed)
+  try:
+    players = (make_player(config[0]), make_player(config[1]))
+    res = {None:0, ttt.Board.default_p1:0, ttt.Board.default_p2:0}
+    records = ttt_log.GameLog(io.BytesIO(), header=False) if log else None
+    for exper in range(0, games):
+      g = ttt.Game(players[0], players[1], log=records)
+      g.start()
+      res[g.b.who_won()] += 1
+  finally:
+    random.setstate(state)
+    if stats:
+      job_stats = ttt.disable_stats()
+      if outer != None:
+        outer.merge(job_stats)
+        ttt.enable_stats(outer)
+  return idx, res, job_stats if stats else None, records.f.getvalue() if log else None
+
+def init_worker(cache_path):
+  if cache_path != None and os.path.exists(cache_path):
+    ttt_player.DRPlayer.cache.load(cache_path)
+
+def run_tournament(configs, games=10, workers=None, seed=0, chunk=10, cache_path=None, stats=None, log=None):
+  '''Play games games for each config, in chunks of at most chunk games played by the same player objects.
+Chunks are spread over workers processes (the number of CPUs if None); workers=1 plays them all in this process.
+Each chunk seeds the random number generator from seed, the config index and the chunk's first game,
+so results depend on seed and chunk but not on workers.
+If stats is a ttt.Stats object, the statistics recorded while playing are added to it.
+If log is a ttt_log.GameLog, every game is written to it, in the same order whatever the number of workers.
+Return, for each config, the tally of winners.'''
+  jobs = []
+  for idx,config in enumerate(configs):
+    for first in range(0, games, chunk):
+      jobs.append((idx, config, min(chunk, games - first), '%s-%d-%d' % (seed, idx, first), stats != None,
+                   log != None))
+  res = [{None:0, ttt.Board.default_p1:0, ttt.Board.default_p2:0} for config in configs]
+  if workers == 1:
+    init_worker(cache_path)
+    executor = None
+  else:
+    executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cache_path,))
+  try:
+    results = map(play_games, jobs) if executor == None else executor.map(play_games, jobs)
+    for idx,tally,job_stats,records in results:
+      for w in tally:
+        res[idx][w] += tally[w]
+      if stats != None: stats.merge(job_stats)
+      if log != None: log.extend(records)
+  finally:
+    if executor != None: executor.shutdown()
+  return res
+
+# Outcome of the games between entrants a and b: a's wins, draws, a's losses, the log-likelihood ratios
+# of the tests "a is stronger" and "b is stronger", and the decision ('a', 'b', 'even' or None if undecided)
+Pairing = collections.namedtuple('Pairing', ('a', 'b', 'wins', 'draws', 'losses', 'llr_a', 'llr_b', 'decision'))
+# Rating of an entrant, in Elo points, and its confidence interval
+Rating = collections.namedtuple('Rating', ('entrant', 'elo', 'low', 'high'))
+
+def entrant_name(entrant):
+  '''Name of entrant, a tuple (class,) or (class, params), e.g. DRPlayer(dr=0.9).'''
+  if len(entrant) == 1 or not entrant[1]: return entrant[0].__name__
+  return '%s(%s)' % (entrant[0].__name__, ', '.join('%s=%s' % kv for kv in sorted(entrant[1].items())))
+
+def parse_entrant(text):
+  '''Entrant from text, a class of ttt_player followed by its params, e.g. DRPlayer:dr=0.9,los=-2.'''
+  name, sep, rest = text.partition(':')
+  cls = getattr(ttt_player, name, None)
+  if not isinstance(cls, type) or not issubclass(cls, ttt.AbsPlayer):
+    raise ValueError("Unknown player %s." % name)
+  if rest == '': return (cls,)
+  params = {}
+  for word in rest.split(','):
+    param, sep, value = word.partition('=')
+    if sep == '' or param not in getattr(cls, 'params', {}):
+      raise ValueError("Unknown parameter %s of %s." % (word, name))
+    params[param] = cls.params[param]['valfun'](value)
+  return (cls, params)
+
+def expected_score(elo):
+  '''Expected score of a player rated elo points above its opponent.'''
+  return 1 / (1 + 10**(-elo / 400))
+
+def llr(wins, draws, losses, elo0, elo1):
+  '''Log-likelihood ratio of "the first player is elo1 points stronger" against "it is elo0 points stronger",
+in the normal approximation of the generalized SPRT: games score 1, 1/2 or 0, and the variance of the score
+is estimated from the games.'''
+  n = wins + draws + losses
+  if n == 0: return 0.0
+  mean = (wins + draws / 2) / n
+  var = (wins * (1 - mean)**2 + draws * (0.5 - mean)**2 + losses * mean**2) / n
+  var = max(var, 1e-6) # All games with the same score
+  s0, s1 = expected_score(elo0), expected_score(elo1)
+  return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * var)
+
+def sprt(pairing, elo, alpha, beta):
+  '''Decision on pairing from two tests: "a is elo points stronger than b" and "b is elo points stronger than a",
+each against "they are even", with false positive rate alpha and false negative rate beta.
+Return (llr_a, llr_b, decision): 'a' or 'b' when a test finds that player stronger, 'even' when both find
+the players even, and None until then.'''
+  lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+  llr_a = llr(pairing.wins, pairing.draws, pairing.losses, 0, elo)
+  llr_b = llr(pairing.losses, pairing.draws, pairing.wins, 0, elo)
+  if llr_a >= upper: return llr_a, llr_b, 'a'
+  if llr_b >= upper: return llr_a, llr_b, 'b'
+  if llr_a <= lower and llr_b <= lower: return llr_a, llr_b, 'even'
+  return llr_a, llr_b, None
+
+def _invert(matrix):
+  '''Inverse of a square matrix, a list of rows, by Gauss-Jordan elimination.'''
+  k = len(matrix)
+  a = [list(row) + [1.0 if i == j else 0.0 for j in range(0, k)] for i,row in enumerate(matrix)]
+  for c in range(0, k):
+    p = max(range(c, k), key=lambda r: abs(a[r][c]))
+    a[c], a[p] = a[p], a[c]
+    pivot = a[c][c]
+    a[c] = [x / pivot for x in a[c]]
+    for r in range(0, k):
+      if r != c and a[r][c] != 0:
+        f = a[r][c]
+        a[r] = [x - f * y for x,y in zip(a[r], a[c])]
+  return [row[k:] for row in a]
+
+def ratings(entrants, pairings, prior=1.0, z=1.96, iterations=1000):
+  '''Bradley-Terry ratings of entrants from pairings, in Elo points averaging 0, by minorization-maximization.
+A draw counts as half a win and half a loss, and prior draws are added to every pairing, so that ratings stay
+finite when a player wins all its games.  Confidence intervals are z standard errors, from the Fisher
+information; with many draws they are conservative.  Return a list of Rating, in the order of entrants.'''
+  k = len(entrants)
+  idx = {entrant_name(e) : i for i,e in enumerate(entrants)}
+  games = [[0.0] * k for i in range(0, k)]
+  score = [0.0] * k
+  for p in pairings:
+    i, j = idx[p.a], idx[p.b]
+    n = p.wins + p.draws + p.losses + prior
+    games[i][j] += n
+    games[j][i] += n
+    score[i] += p.wins + (p.draws + prior) / 2
+    score[j] += p.losses + (p.draws + prior) / 2
+  gamma = [1.0] * k
+  for it in range(0, iterations):
+    new = [score[i] / sum(games[i][j] / (gamma[i] + gamma[j]) for j in range(0, k) if games[i][j])
+           if any(games[i]) else 1.0 for i in range(0, k)]
+    mean = math.exp(sum(math.log(g) for g in new) / k)
+    new = [g / mean for g in new]
+    done = max(abs(math.log(g / h)) for g,h in zip(new, gamma)) < 1e-10
+    gamma = new
+    if done: break
+  # Fisher information of the natural-log ratings, a Laplacian; its pseudo-inverse is their covariance
+  info = [[0.0] * k for i in range(0, k)]
+  for i in range(0, k):
+    for j in range(0, k):
+      if i != j and games[i][j]:
+        w = games[i][j] * gamma[i] * gamma[j] / (gamma[i] + gamma[j])**2
+        info[i][j] -= w
+        info[i][i] += w
+  cov = _invert([[x + 1 / k for x in row] for row in info])
+  scale = 400 / math.log(10)
+  res = []
+  for i,e in enumerate(entrants):
+    elo = scale * math.log(gamma[i])
+    se = scale * math.sqrt(max(cov[i][i] - 1 / k, 0.0))
+    res.append(Rating(entrant_name(e), elo, elo - z * se, elo + z * se))
+  return res
+
+def round_robin(entrants, elo=50, alpha=0.05, beta=0.05, min_games=20, max_games=1000, chunk=10, workers=None,
+                seed=0, cache_path=None, log=None, report=None):
+  '''Play every pair of entrants, tuples (class,) or (class, params), until sprt() decides on the pair,
+after at least min_games and at most max_games games.  Games are played in rounds, where every undecided pair
+plays a chunk of games in each seat order, so decisions, like the results of run_tournament(), depend on seed
+and chunk but not on workers.  If report is set, it is called with a line on each round.
+Return (list of Pairing, list of Rating from ratings()).'''
+  names = [entrant_name(e) for e in entrants]
+  if len(set(names)) != len(names): raise ValueError("Entrants must differ.")
+  pairs = list(itertools.combinations(range(0, len(entrants)), 2))
+  pairings = [Pairing(names[a], names[b], 0, 0, 0, 0.0, 0.0, None) for a,b in pairs]
+  def spec(e, mark): return (e[0], mark) if len(e) == 1 else (e[0], mark, e[1])
+  if workers == 1:
+    init_worker(cache_path)
+    executor = None
+  else:
+    executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cache_path,))
+  try:
+    rnd = 0
+    while True:
+      jobs = []
+      for idx,(a,b) in enumerate(pairs):
+        p = pairings[idx]
+        n = p.wins + p.draws + p.losses
+        if p.decision != None or n >= max_games: continue
+        games = min(chunk, (max_games - n + 1) // 2)
+        for seat,(first,second) in enumerate(((a, b), (b, a))):
+          config = (spec(entrants[first], x), spec(entrants[second], o))
+          jobs.append((2*idx + seat, config, games, '%s-%d-%d-%d' % (seed, idx, seat, rnd), False, log != None))
+      if jobs == []: break
+      results = map(play_games, jobs) if executor == None else executor.map(play_games, jobs)
+      for job_idx,tally,job_stats,records in results:
+        idx, seat = divmod(job_idx, 2)
+        mine, theirs = (x, o) if seat == 0 else (o, x)
+        p = pairings[idx]
+        p = p._replace(wins=p.wins + tally[mine], draws=p.draws + tally[None], losses=p.losses + tally[theirs])
+        llr_a, llr_b, decision = sprt(p, elo, alpha, beta)
+        if p.wins + p.draws + p.losses < min_games: decision = None
+        pairings[idx] = p._replace(llr_a=llr_a, llr_b=llr_b, decision=decision)
+        if log != None: log.extend(records)
+      rnd += 1
+      if report != None:
+        undecided = sum(1 for p in pairings if p.decision == None)
+        report('round %d: %d games, %d of %d pairs undecided' % (
+               rnd, sum(p.wins + p.draws + p.losses for p in pairings), undecided, len(pairings)))
+  finally:
+    if executor != None: executor.shutdown()
+  return pairings, ratings(entrants, pairings)
+
 def main(argv):
+  parser = argparse.ArgumentParser(description='Play tic-tac-toe tournaments between machine players.')
+  # File to warm-start DRPlayer's shared reward cache from, and to save it to at the end
+  parser.add_argument('cache', nargs='?', default=None, help="DRPlayer's reward cache file")
+  parser.add_argument('--games', type=int, default=10, help='games per config')
+  parser.add_argument('--workers', type=int, default=1, help='worker processes, 0 for one per CPU')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--chunk', type=int, default=10, help='games played by the same player objects')
+  parser.add_argument('--stats', action='store_true', help='record and print where the time goes')
+  parser.add_argument('--log', help='append every game to this game log, see ttt_log')
+  parser.add_argument('--round-robin', action='store_true',
+                      help='play every pair of entrants until a sequential test decides, and rate them')
+  parser.add_argument('--entrant', action='append', default=[],
+                      help='round robin: a player class and its params, e.g. DRPlayer:dr=0.9 (repeat for each entrant)')
+  parser.add_argument('--elo', type=float, default=50, help='round robin: difference in Elo points to detect')
+  parser.add_argument('--min-games', type=int, default=20, help='round robin: games per pair before deciding')
+  parser.add_argument('--max-games', type=int, default=1000, help='round robin: games per pair at most')
+  args = parser.parse_args(argv[1:])
+
+  if args.round_robin:
+    entrants = [parse_entrant(e) for e in args.entrant] or [
+      (ttt_player.APlayer,), (ttt_player.DPlayer,), (ttt_player.ADPlayer,), (ttt_player.DRPlayer,),
+      (ttt_player.DRPlayer, {'dr':0.9}), (ttt_player.RLPlayer,), (ttt_player.NegamaxPlayer,)]
+    log = ttt_log.GameLog(args.log) if args.log != None else None
+    pairings, rates = round_robin(entrants, elo=args.elo, min_games=args.min_games, max_games=args.max_games,
+                                  chunk=args.chunk, workers=args.workers or None, seed=args.seed,
+                                  cache_path=args.cache, log=log, report=print)
+    if log != None: log.close()
+    for p in pairings:
+      decision = {'a' : p.a + ' stronger', 'b' : p.b + ' stronger', 'even' : 'even', None : 'undecided'}[p.decision]
+      print('%s vs %s: +%d =%d -%d, %s' % (p.a, p.b, p.wins, p.draws, p.losses, decision))
+    for r in sorted(rates, key=lambda r: -r.elo):
+      print('%-30s %6.0f  [%6.0f, %6.0f]' % (r.entrant, r.elo, r.low, r.high))
+    return 0
+
   configs= (
-    (ttt_player.APlayer(ttt.Board.default_p1),  ttt_player.APlayer(ttt.Board.default_p2)),
-    (ttt_player.APlayer(ttt.Board.default_p1),  ttt_player.ADPlayer(ttt.Board.default_p2)),
-    (ttt_player.APlayer(ttt.Board.default_p1),  ttt_player.DPlayer(ttt.Board.default_p2)),
-    (ttt_player.ADPlayer(ttt.Board.default_p1), ttt_player.APlayer(ttt.Board.default_p2)),
-    (ttt_player.ADPlayer(ttt.Board.default_p1), ttt_player.ADPlayer(ttt.Board.default_p2)),
-    (ttt_player.ADPlayer(ttt.Board.default_p1), ttt_player.DPlayer(ttt.Board.default_p2)),
-    (ttt_player.DPlayer(ttt.Board.default_p1),  ttt_player.APlayer(ttt.Board.default_p2)),
-    (ttt_player.DPlayer(ttt.Board.default_p1),  ttt_player.ADPlayer(ttt.Board.default_p2)),
-    (ttt_player.DPlayer(ttt.Board.default_p1),  ttt_player.DPlayer(ttt.Board.default_p2)),
+    ((ttt_player.APlayer, x),  (ttt_player.APlayer, o)),
+    ((ttt_player.APlayer, x),  (ttt_player.ADPlayer, o)),
+    ((ttt_player.APlayer, x),  (ttt_player.DPlayer, o)),
+    ((ttt_player.ADPlayer, x), (ttt_player.APlayer, o)),
+    ((ttt_player.ADPlayer, x), (ttt_player.ADPlayer, o)),
+    ((ttt_player.ADPlayer, x), (ttt_player.DPlayer, o)),
+    ((ttt_player.DPlayer, x),  (ttt_player.APlayer, o)),
+    ((ttt_player.DPlayer, x),  (ttt_player.ADPlayer, o)),
+    ((ttt_player.DPlayer, x),  (ttt_player.DPlayer, o)),
   )
   configs= (
-    (ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95}), ttt_player.DRPlayer(ttt.Board.default_p2)),
-    (ttt_player.DRPlayer(ttt.Board.default_p1), ttt_player.DRPlayer(ttt.Board.default_p2,params={'dr':0.95})),
+    ((ttt_player.DRPlayer, x, {'dr':0.95}), (ttt_player.DRPlayer, o)),
+    ((ttt_player.DRPlayer, x), (ttt_player.DRPlayer, o, {'dr':0.95})),
   )
   configs = (
-    (ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95}), ttt_player.APlayer(ttt.Board.default_p2)),
-    (ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.9}), ttt_player.ADPlayer(ttt.Board.default_p2)),
-    (ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95}), ttt_player.DPlayer(ttt.Board.default_p2)),
-    (ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95}), ttt_player.DRPlayer(ttt.Board.default_p2)),
-
-    (ttt_player.APlayer(ttt.Board.default_p2),  ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95})),
-    (ttt_player.ADPlayer(ttt.Board.default_p2), ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95})),
-    (ttt_player.DPlayer(ttt.Board.default_p2),  ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95})),
-    (ttt_player.DRPlayer(ttt.Board.default_p2), ttt_player.DRPlayer(ttt.Board.default_p1,params={'dr':0.95})),
-  )
+    ((ttt_player.DRPlayer, x, {'dr':0.95}), (ttt_player.APlayer, o)),
+    ((ttt_player.DRPlayer, x, {'dr':0.9}),  (ttt_player.ADPlayer, o)),
+    ((ttt_player.DRPlayer, x, {'dr':0.95}), (ttt_player.DPlayer, o)),
+    ((ttt_player.DRPlayer, x, {'dr':0.95}), (ttt_player.DRPlayer, o)),
 
+    ((ttt_player.APlayer, o),  (ttt_player.DRPlayer, x, {'dr':0.95})),
+    ((ttt_player.ADPlayer, o), (ttt_player.DRPlayer, x, {'dr':0.95})),
+    ((ttt_player.DPlayer, o),  (ttt_player.DRPlayer, x, {'dr':0.95})),
+    ((ttt_player.DRPlayer, o), (ttt_player.DRPlayer, x, {'dr':0.95})),
+  )
 
-  res = []
+  stats = ttt.Stats() if args.stats else None
+  log = ttt_log.GameLog(args.log) if args.log != None else None
+  res = run_tournament(configs, games=args.games, workers=args.workers or None, seed=args.seed,
+                       chunk=args.chunk, cache_path=args.cache, stats=stats, log=log)
+  if log != None: log.close()
   for idx,config in enumerate(configs):
-    res.append({None:0, ttt.Board.default_p1:0, ttt.Board.default_p2:0})
-    for exper in range(0, 10):
-      g = ttt.Game(config[0],config[1])
-      g.start()
-      res[idx][g.b.who_won()] += 1
-    print('%s, %s vs %s' % (res[idx], config[0].name, config[1].name))
-    
+    print('%s, %s vs %s' % (res[idx], config[0][0].name, config[1][0].name))
+  # With worker processes, the rewards are computed and cached in the workers
+  if args.workers == 1:
+    cache = ttt_player.DRPlayer.cache
+    print('DRPlayer reward cache: %d rewards, %d hits, %d misses' % (len(cache), cache.hits, cache.misses))
+    if args.cache != None:
+      cache.save(args.cache)
+  if stats != None:
+    print(stats)
 
 if __name__ == '__main__':
   sys.exit(main(sys.argv))
@@ -3,21 +3,256 @@ __author__  = "Daniel S. Fava"
 __license__ = "License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
 __year__    = "2018"
 
+import os
 import sys
 import abc
 import copy
+import time
+import concurrent.futures
+
+# The 8 rotations and reflections of the board.
+# Transform t moves the mark at position k=3*i+j to position TRANSFORMS[t][k].
+def _rotate(k): return 3*(k % 3) + 2 - k // 3
+def _mirror(k): return 3*(k // 3) + 2 - k % 3
+def _compose(f, g): return tuple(f[g[k]] for k in range(0, 9))
+_ROTATIONS = [tuple(range(0, 9))]
+for _ in range(0, 3): _ROTATIONS.append(_compose(tuple(_rotate(k) for k in range(0, 9)), _ROTATIONS[-1]))
+TRANSFORMS = tuple(_ROTATIONS + [_compose(tuple(_mirror(k) for k in range(0, 9)), r) for r in _ROTATIONS])
+INVERSE = tuple(TRANSFORMS.index(tuple(t.index(k) for k in range(0, 9))) for t in TRANSFORMS)
+_POW3 = tuple(tuple(3**(8-t[k]) for k in range(0, 9)) for t in TRANSFORMS)
+
+def transform_move(move, t, m=3, n=3):
+  '''Map move (i,j) on an m x n board through transform t.  Use INVERSE[t] to map it back.
+Transforms 1, 3, 5 and 7 turn the board by a quarter and only apply to square boards.'''
+  if m == 3 and n == 3:
+    k = TRANSFORMS[t][3*move[0] + move[1]]
+    return (k // 3, k % 3)
+  i, j = move
+  if t % 4 == 2:
+    i, j = m - 1 - i, n - 1 - j
+  else:
+    for _ in range(0, t % 4): i, j = j, n - 1 - i
+  if t >= 4: j = n - 1 - j
+  return (i, j)
+
+class Stats():
+  '''Counters filled in while instrumentation is enabled, see enable_stats().'''
+
+  def __init__(self):
+    self.boards = 0              # Board instances created
+    self.descendants_visited = 0 # Boards visited by get_descendants()
+    self.moves = {}              # Player -> [number of moves, total seconds, longest move in seconds]
+    self.caches = {}             # Cache name -> [hits, misses]
+
+  def move(self, player, seconds):
+    try:
+      m = self.moves[player]
+      m[0] += 1
+      m[1] += seconds
+      if seconds > m[2]: m[2] = seconds
+    except KeyError:
+      self.moves[player] = [1, seconds, seconds]
+
+  def cache(self, name, hit):
+    try: c = self.caches[name]
+    except KeyError: c = self.caches[name] = [0, 0]
+    c[0 if hit else 1] += 1
+
+  def merge(self, other):
+    '''Add the counters of other to these.'''
+    self.boards += other.boards
+    self.descendants_visited += other.descendants_visited
+    for player in other.moves:
+      n, total, longest = other.moves[player]
+      m = self.moves.setdefault(player, [0, 0.0, 0.0])
+      m[0] += n
+      m[1] += total
+      m[2] = max(m[2], longest)
+    for name in other.caches:
+      c = self.caches.setdefault(name, [0, 0])
+      c[0] += other.caches[name][0]
+      c[1] += other.caches[name][1]
+
+  def as_dict(self):
+    return {'boards' : self.boards,
+            'descendants_visited' : self.descendants_visited,
+            'moves' : {player : {'moves' : m[0], 'seconds' : m[1], 'longest' : m[2]} for player,m in self.moves.items()},
+            'caches' : {name : {'hits' : c[0], 'misses' : c[1]} for name,c in self.caches.items()}}
+
+  def __str__(self):
+    lines = ['Boards created: %d' % self.boards,
+             'Boards visited by get_descendants(): %d' % self.descendants_visited]
+    for name,(hits,misses) in sorted(self.caches.items()):
+      lines.append('Cache %s: %d hits, %d misses, %.1f%% hit rate' % (name, hits, misses, 100.0 * hits / max(1, hits + misses)))
+    for player,(n,total,longest) in sorted(self.moves.items()):
+      lines.append('Player %s: %d moves, %.3f ms per move, %.3f ms longest' % (player, n, 1e3 * total / n, 1e3 * longest))
+    return '\n'.join(lines)
+
+# Instrumentation: a Stats object while enabled, None otherwise.
+# Instrumented code checks stats against None before recording anything, so that it costs close to nothing when disabled.
+stats = None
+
+def enable_stats(s=None):
+  '''Start recording statistics in s, a new Stats object if None, and return it.'''
+  global stats
+  stats = s if s != None else Stats()
+  return stats
+
+def disable_stats():
+  '''Stop recording statistics, and return the Stats object recorded so far.'''
+  global stats
+  s = stats
+  stats = None
+  return s
+
+class BoardPool():
+  '''Pool of interned boards, keyed by position.
+Boards obtained through the pool are shared, so equal boards are the same object.
+The pool holds at most maxsize boards (no limit if maxsize is None); it is cleared when it fills up.'''
+
+  def __init__(self, maxsize=None):
+    self.maxsize = maxsize
+    self.boards = {}
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, b, e, p1, p2, it):
+    '''Return the interned board with configuration b, creating it if needed.'''
+    key = (b, e, p1, p2, it)
+    try:
+      nb = self.boards[key]
+      self.hits += 1
+      return nb
+    except KeyError:
+      pass
+    self.misses += 1
+    if self.maxsize != None and len(self.boards) >= self.maxsize:
+      self.clear()
+    nb = Board(b=b, e=e, p1=p1, p2=p2, it=it)
+    self.boards[key] = nb
+    return nb
+
+  def clear(self):
+    self.boards.clear()
+
+  def __len__(self):
+    return len(self.boards)
+
+class OutcomeCounter():
+  '''Memoized count of the winners of the descendants of boards.
+The descendants of a board are the board itself and the descendants of its children.
+Each descendant set is kept as an integer with one bit per board, so that the set of a board is computed
+once from the sets of its children, and boards reachable through several paths are counted once.'''
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self.desc = {}  # Board -> set of descendants
+    self.masks = {} # Winner -> set of boards won by the winner
+    self.counts = {}
+
+  def _key(self, b):
+    # Boards compare by position only; the marks and whose turn it is determine the descendants too
+    return (b, b.e, b.p1, b.p2, b.it % 2)
+
+  def _descendants(self, b):
+    key = self._key(b)
+    try: return self.desc[key]
+    except KeyError: pass
+    bit = 1 << len(self.desc)
+    w = b.who_won()
+    self.masks[w] = self.masks.get(w, 0) | bit
+    self.desc[key] = bit # Claim the bit before visiting the children, which claim the next ones
+    d = bit
+    for c in b.iter_children():
+      d |= self._descendants(c)
+    self.desc[key] = d
+    return d
+
+  def count(self, b):
+    '''Return {None : n, p1 : n, p2 : n}, the number of descendants of b won by each player.'''
+    key = self._key(b)
+    try: return dict(self.counts[key])
+    except KeyError: pass
+    d = self._descendants(b)
+    self.counts[key] = {w : (d & self.masks.get(w, 0)).bit_count() for w in (None, b.p1, b.p2)}
+    return dict(self.counts[key])
+
+# The 8 lines of the board, as positions k=3*i+j
+LINES = ((0,1,2), (3,4,5), (6,7,8),  # Rows
+         (0,3,6), (1,4,7), (2,5,8),  # Columns
+         (0,4,8), (2,4,6))           # Diagonals
+# Occupancy of the lines, see Board._line_index(): line l takes bits 4*l to 4*l+3, and holds the number
+# of marks of p1 in the line plus 4 times the number of marks of p2.  _LINE_ADD[0][k] adds a mark of p1
+# on position k to every line through k, _LINE_ADD[1][k] a mark of p2.
+_LINE_ADD = tuple(tuple(sum(w << 4*l for l,line in enumerate(LINES) if k in line) for k in range(0, 9)) for w in (1, 4))
 
 class Board():
 
+  # The game status (_winner, _empty and _over) and the occupancy of the lines (_lines) are carried forward by
+  # play(), and computed on first use otherwise
+  __slots__ = ('e', 'p1', 'p2', 'b', 'it', '_hash', '_winner', '_empty', '_over', '_lines')
+
   default_p1 = 'x'
   default_p2 = 'o'
 
+  # Rows, columns, and marks in a line needed to win; see MNKBoard for other sizes
+  m = n = k = 3
+
+  # Flyweight mode: if set to a BoardPool, boards created by play() and get_children() are interned in the pool
+  pool = None
+  # Shared by all boards, so that counts computed for one move are reused in later moves and games
+  outcomes = OutcomeCounter()
+
   @classmethod
-  def enum_confs():
-    '''Enumerate all possible tic-tac-toe board configurations.
-Play starts with player p1.'''
-    b = Board()
-    return b.get_descendants()
+  def enum_confs(cls, workers=1, report=None, **kwargs):
+    '''Enumerate all possible tic-tac-toe board configurations: return the set of the codes (see encode()) of the
+boards reachable from the empty board cls(**kwargs), e.g. MNKBoard.enum_confs(m=4, n=4, k=3).
+Play starts with player p1.  Decode codes with decode() of the empty board.
+
+Boards are expanded one move at a time, on workers processes (one per CPU if None, in this process if 1):
+the shards of the first move are the opening moves, and the boards of every later move are dealt out to the
+workers, so that each board is expanded once.  Boards after d moves have d marks, so shards only need to be
+merged with the other shards of the same move.  If report is set, it is called with the boards per second.'''
+    root = cls(**kwargs)
+    if workers == None: workers = os.cpu_count()
+    start = time.perf_counter()
+    executor = concurrent.futures.ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+      frontier = [root.encode()]
+      codes = set(frontier)
+      while frontier:
+        if executor == None:
+          shards = [_expand_codes(cls, kwargs, frontier)]
+        else:
+          n = min(len(frontier), 4 * workers) # A few shards per worker, to even out their sizes
+          shards = executor.map(_expand_codes, [cls] * n, [kwargs] * n, [frontier[idx::n] for idx in range(0, n)])
+        nxt = set()
+        for shard in shards:
+          nxt |= shard
+        codes |= nxt
+        frontier = list(nxt)
+    finally:
+      if executor != None: executor.shutdown()
+    if report != None:
+      t = time.perf_counter() - start
+      report('%d boards in %.2f s, %.0f boards/s on %d worker(s)' % (len(codes), t, len(codes) / t, workers))
+    return codes
+
+  def decode(self, code):
+    '''Return the board of the size and marks of this board with code, as returned by encode().'''
+    marks = (self.e, self.p1, self.p2)
+    cells = []
+    for k in range(0, self.m * self.n):
+      cells.append(marks[code % 3])
+      code //= 3
+    cells.reverse()
+    b = tuple(tuple(cells[i*self.n:(i+1)*self.n]) for i in range(0, self.m))
+    return self._decoded(b, self.m * self.n - cells.count(self.e))
+
+  def _decoded(self, b, it):
+    return type(self)(b, self.e, self.p1, self.p2, it)
 
   def __init__(self, b=None, e=' ', p1=default_p1, p2=default_p2, it=0):
     '''New board.  If b is None, start with an empty board.
@@ -30,14 +265,56 @@ Does not check for validity of the board; user can pass, for example, a board co
     else:
       self.b = b
     self.it = it # Iteration of the game
+    if stats != None: stats.boards += 1
+
+  def _new(self, b, it):
+    '''New board with configuration b and the same marks as this board, interned if Board.pool is set.'''
+    if Board.pool != None: return Board.pool.get(b, self.e, self.p1, self.p2, it)
+    return Board(b=b, e=self.e, p1=self.p1, p2=self.p2, it=it)
 
   def __hash__(self):
+    try: return self._hash # Boards are immutable, the hash is computed once
+    except AttributeError: pass
     map_val = {self.e : '0', self.p1 : '1', self.p2 : '2'}
-    return int('1' + ''.join([map_val[el] for r in self.b for el in r]))
+    self._hash = int('1' + ''.join([map_val[el] for r in self.b for el in r]))
+    return self._hash
+
+  def encode(self):
+    '''Return the board as a number in base 3, position (0,0) being the most significant digit.
+Digits are 0 for an empty position, 1 for p1 and 2 for p2.'''
+    map_val = {self.e : 0, self.p1 : 1, self.p2 : 2}
+    code = 0
+    for r in self.b:
+      for el in r:
+        code = 3*code + map_val[el]
+    return code
+
+  def transform(self, t):
+    '''Return the board obtained by applying transform t (an index into TRANSFORMS) to this board.'''
+    cells = [el for r in self.b for el in r]
+    new_cells = [None]*9
+    for k in range(0, 9):
+      new_cells[TRANSFORMS[t][k]] = cells[k]
+    nb = self._new(tuple(tuple(new_cells[3*i:3*i+3]) for i in range(0,3)), self.it)
+    for attr in ('_winner', '_empty', '_over'): # Rotations and reflections do not change the game status
+      try: setattr(nb, attr, getattr(self, attr))
+      except AttributeError: pass
+    return nb
+
+  def canonical(self):
+    '''Return (c, t), where c is the canonical form of this board and t the transform mapping this board to c.
+All rotations and reflections of a board have the same canonical form: the one with smallest encode().
+Moves on c map back to moves on this board through INVERSE[t].'''
+    map_val = {self.e : 0, self.p1 : 1, self.p2 : 2}
+    cells = [map_val[el] for r in self.b for el in r]
+    codes = [sum(d*p for d,p in zip(cells, pows)) for pows in _POW3]
+    t = codes.index(min(codes))
+    if t == 0: return (self, 0)
+    return (self.transform(t), t)
 
   def __eq__(self, other):
     '''Boards are equal if their hashes are equal'''
-    return hash(self) == hash(other)
+    return self is other or hash(self) == hash(other)
 
   def __le__(self, other):
     for idx_r,r in enumerate(self.b):
@@ -67,7 +344,43 @@ Does not check for validity of the board; user can pass, for example, a board co
         new_board.append(tuple([el if el_idx!=j else player for el_idx,el in enumerate(r)]))
       else:
         new_board.append(r)
-    return Board(b=tuple(new_board), e=self.e, p1=self.p1, p2=self.p2, it=self.it+1)
+    nb = self._new(tuple(new_board), self.it+1)
+    # The game was not over, so the new board is won only if player completed a line through (i,j)
+    b = nb.b
+    won = b[i][0] == b[i][1] == b[i][2] or b[0][j] == b[1][j] == b[2][j] or \
+        (i == j and b[0][0] == b[1][1] == b[2][2]) or (i + j == 2 and b[0][2] == b[1][1] == b[2][0])
+    nb._winner = player if won else None
+    nb._empty = self._count_empty() - 1
+    nb._over = won or nb._empty == 0
+    nb._lines = self._line_index() + _LINE_ADD[player != self.p1][3*i + j]
+    return nb
+
+  def _line_index(self):
+    try: return self._lines
+    except AttributeError: pass
+    cells = [el for r in self.b for el in r]
+    self._lines = sum(_LINE_ADD[el != self.p1][k] for k,el in enumerate(cells) if el != self.e)
+    return self._lines
+
+  def winning_squares(self, p):
+    '''Return the empty positions (i,j) where p would complete a line, in the order of get_empty_idxs().'''
+    if p == self.p1: two = 2
+    elif p == self.p2: two = 8
+    else: return []
+    lines = self._line_index()
+    ks = []
+    for l,line in enumerate(LINES):
+      if (lines >> 4*l) & 15 == two: # Two marks of p, the third position empty
+        ks += [k for k in line if self.b[k // 3][k % 3] == self.e]
+    return [(k // 3, k % 3) for k in sorted(set(ks))]
+
+  def open_lines(self, p):
+    '''Return the number of lines without a mark of the adversary of p: the lines p may still complete.'''
+    if p == self.p1: adv = 12
+    elif p == self.p2: adv = 3
+    else: return 0
+    lines = self._line_index()
+    return sum(1 for l in range(0, len(LINES)) if not (lines >> 4*l) & adv)
 
   def get_children(self):
     '''Return all possible children of the given board configuration.'''
@@ -80,22 +393,43 @@ Does not check for validity of the board; user can pass, for example, a board co
       children.append(nb)
     return children
 
-  def get_descendants(self):
-    '''Return all descendants of the given board.'''
-    processed_lst = []  # Keeping a list simply because I like to see elements somewhat in order
-    processed = set() 
-    to_process = [self] # Add current board to "to_process"
+  def iter_children(self):
+    '''Generate the children of the board, in the order of get_children().'''
+    if self.next_player() == None: return
+    for idx in self.get_empty_idxs():
+      yield self.play(idx)
+
+  def get_descendants(self, canonical=False):
+    '''Return all descendants of the given board.
+If canonical is True, return only one board per class of rotations and reflections, in its canonical form.'''
+    return list(self.iter_descendants(canonical))
+
+  def iter_descendants(self, canonical=False, prune=None, visited=True):
+    '''Generate the descendants of the board, the board included, in the order of get_descendants().
+The children of a board b are not visited if prune(b) is true; b itself is generated.
+If visited is False, boards are not remembered: a board reached by n paths is generated n times,
+but memory stays proportional to the depth of the tree.'''
+    processed = set() if visited else None
+    to_process = [self.canonical()[0] if canonical else self] # Add current board to "to_process"
     while len(to_process) != 0:
       # Remove a conf from to_process
       b_to_process = to_process.pop()
-      processed.add(b_to_process)
-      processed_lst.append(b_to_process)
-      children = b_to_process.get_children()
-      # For every board b in bs not already in "processed", add b to "to_process"
-      for b in children:
-        if b not in processed:
+      if visited:
+        if b_to_process in processed: continue # Reached by more than one path before being processed
+        processed.add(b_to_process)
+      # Counted as it is generated, so that a caller stopping early sees the boards it got
+      if stats != None: stats.descendants_visited += 1
+      yield b_to_process
+      if prune != None and prune(b_to_process): continue
+      # For every child b not already in "processed", add b to "to_process"
+      for b in b_to_process.iter_children():
+        if canonical: b = b.canonical()[0]
+        if not visited or b not in processed:
           to_process.append(b)
-    return processed_lst
+
+  def outcome_counts(self):
+    '''Return {None : n, p1 : n, p2 : n}, the number of boards in get_descendants() won by each player.'''
+    return Board.outcomes.count(self)
 
   def next_player(self):
     '''Determine who may be the next player.
@@ -107,22 +441,37 @@ If player A played the same number of times as B, then it may be player A's or p
     else: return self.p2
 
   def __str__(self):
-    return str(self.b[0]) + '\n' + str(self.b[1]) + '\n' + str(self.b[2])
+    return '\n'.join(str(r) for r in self.b)
 
   def is_over(self):
     '''A check for whether the game is over.
 Returns true if the board is full or one of the players won; returns false otherwise.'''
-    return self.is_full() or self.who_won() != None
+    try: return self._over
+    except AttributeError: pass
+    self._over = self.is_full() or self.who_won() != None
+    return self._over
+
+  def _count_empty(self):
+    try: return self._empty
+    except AttributeError: pass
+    self._empty = sum(r.count(self.e) for r in self.b)
+    return self._empty
 
   def is_empty(self):
-    return len(self.get_empty_idxs()) == 9
+    return self._count_empty() == self.m * self.n
 
   def is_full(self):
     '''Return true if the board is full.'''
-    return self.get_empty_idxs() == []
+    return self._count_empty() == 0
 
   def who_won(self):
     '''Return p if game has been won by a player p; None otherwise (i.e. no player has won the game)'''
+    try: return self._winner
+    except AttributeError: pass
+    self._winner = self._find_winner()
+    return self._winner
+
+  def _find_winner(self):
     # Columns
     for c in range(0,3):
       if self.b[0][c] != self.e and (self.b[0][c] == self.b[1][c] == self.b[2][c]): return self.b[0][c]
@@ -148,6 +497,301 @@ Returns true if the board is full or one of the players won; returns false other
     assert(0)
 
 
+# Bit k of a mask corresponds to position (k // 3, k % 3) on the board.
+WIN_MASKS = (0b000000111, 0b000111000, 0b111000000, # Rows
+             0b001001001, 0b010010010, 0b100100100, # Columns
+             0b100010001, 0b001010100)              # Diagonals
+FULL_MASK = 0b111111111
+
+# Lookup tables indexed by a 9-bit mask
+_WINS = tuple(any(m & w == w for w in WIN_MASKS) for m in range(0, FULL_MASK+1))
+# Mask of the positions, not in m, that complete a line of the marks in m
+_COMPLETES = tuple(sum(1 << k for k in range(0, 9) if not (m >> k) & 1 and
+                       any((w >> k) & 1 and (m | 1 << k) & w == w for w in WIN_MASKS))
+                   for m in range(0, FULL_MASK+1))
+_EMPTY_IDXS = tuple(tuple((k // 3, k % 3) for k in range(0, 9) if not (m >> k) & 1) for m in range(0, FULL_MASK+1))
+_DEC = tuple(sum(10**(8-k) for k in range(0, 9) if (m >> k) & 1) for m in range(0, FULL_MASK+1))
+_TER = tuple(sum(3**(8-k) for k in range(0, 9) if (m >> k) & 1) for m in range(0, FULL_MASK+1))
+_PERM = tuple(tuple(sum(1 << t[k] for k in range(0, 9) if (m >> k) & 1) for m in range(0, FULL_MASK+1)) for t in TRANSFORMS)
+
+class BitBoard(Board):
+  '''Board that keeps the marks of each player as a 9-bit integer, see WIN_MASKS.
+Offers the same interface as Board, and a BitBoard is equal to a Board with the same configuration.'''
+
+  __slots__ = ('m1', 'm2')
+
+  def __init__(self, b=None, e=' ', p1=Board.default_p1, p2=Board.default_p2, it=0):
+    self.e = e
+    self.p1 = p1
+    self.p2 = p2
+    self.m1 = 0
+    self.m2 = 0
+    if b != None:
+      for k in range(0, 9):
+        el = b[k // 3][k % 3]
+        if el == p1: self.m1 |= 1 << k
+        elif el == p2: self.m2 |= 1 << k
+    self.it = it
+    if stats != None: stats.boards += 1
+
+  @classmethod
+  def from_masks(cls, m1, m2, e=' ', p1=Board.default_p1, p2=Board.default_p2, it=0):
+    '''New board from the masks of players p1 and p2, skipping the parsing done in __init__.'''
+    nb = cls.__new__(cls)
+    nb.e = e
+    nb.p1 = p1
+    nb.p2 = p2
+    nb.m1 = m1
+    nb.m2 = m2
+    nb.it = it
+    if stats != None: stats.boards += 1
+    return nb
+
+  @property
+  def b(self):
+    return tuple(tuple(self._cell(3*i + j) for j in range(0,3)) for i in range(0,3))
+
+  def _cell(self, k):
+    if (self.m1 >> k) & 1: return self.p1
+    if (self.m2 >> k) & 1: return self.p2
+    return self.e
+
+  def __hash__(self):
+    # Same value as Board.__hash__, so that Board and BitBoard can be mixed in sets and dicts
+    return 10**9 + _DEC[self.m1] + 2*_DEC[self.m2]
+
+  def encode(self):
+    return _TER[self.m1] + 2*_TER[self.m2]
+
+  def transform(self, t):
+    return BitBoard.from_masks(_PERM[t][self.m1], _PERM[t][self.m2], self.e, self.p1, self.p2, self.it)
+
+  def canonical(self):
+    codes = [_TER[p[self.m1]] + 2*_TER[p[self.m2]] for p in _PERM]
+    t = codes.index(min(codes))
+    if t == 0: return (self, 0)
+    return (self.transform(t), t)
+
+  def __le__(self, other):
+    if isinstance(other, BitBoard):
+      return self.m1 & ~other.m1 == 0 and self.m2 & ~other.m2 == 0
+    return super().__le__(other)
+
+  def play(self, i, j=0):
+    if type(i) == list or type(i) == tuple:
+      j = i[1]
+      i = i[0]
+    player = self.next_player()
+    if player == None:
+      raise RuntimeWarning("Function play() was called on a game that is over.")
+    bit = 1 << (3*i + j)
+    if (self.m1 | self.m2) & bit:
+      raise RuntimeWarning("Board not empty at position (%d,%d)" % (i,j))
+    if player == self.p1:
+      return BitBoard.from_masks(self.m1 | bit, self.m2, self.e, self.p1, self.p2, self.it+1)
+    return BitBoard.from_masks(self.m1, self.m2 | bit, self.e, self.p1, self.p2, self.it+1)
+
+  def iter_children(self):
+    return iter(self.get_children()) # Building the list at once is faster than play() on each empty cell
+
+  def get_children(self):
+    player = self.next_player()
+    if player == None: return []
+    occ = self.m1 | self.m2
+    if player == self.p1:
+      return [BitBoard.from_masks(self.m1 | (1 << k), self.m2, self.e, self.p1, self.p2, self.it+1)
+              for k in range(0, 9) if not (occ >> k) & 1]
+    return [BitBoard.from_masks(self.m1, self.m2 | (1 << k), self.e, self.p1, self.p2, self.it+1)
+            for k in range(0, 9) if not (occ >> k) & 1]
+
+  def is_empty(self):
+    return self.m1 | self.m2 == 0
+
+  def is_full(self):
+    return self.m1 | self.m2 == FULL_MASK
+
+  def who_won(self):
+    if _WINS[self.m1]: return self.p1
+    if _WINS[self.m2]: return self.p2
+    return None
+
+  def get_empty_idxs(self):
+    return list(_EMPTY_IDXS[self.m1 | self.m2])
+
+  def winning_squares(self, p):
+    if p == self.p1: m = self.m1
+    elif p == self.p2: m = self.m2
+    else: return []
+    return list(_EMPTY_IDXS[FULL_MASK ^ (_COMPLETES[m] & ~(self.m1 | self.m2))])
+
+  def open_lines(self, p):
+    if p == self.p1: adv = self.m2
+    elif p == self.p2: adv = self.m1
+    else: return 0
+    return sum(1 for w in WIN_MASKS if not w & adv)
+
+  def __getitem__(self, i):
+    if type(i) == int:
+      return tuple(self._cell(3*i + j) for j in range(0,3))
+    if type(i) == tuple:
+      return self._cell(3*i[0] + i[1])
+    assert(0)
+
+
+class MNKBoard(Board):
+  '''Board with m rows and n columns, where a player wins with k marks in a row, column or diagonal.
+Only the lines through the last move are checked for a win, so who_won() takes O(k) time on boards created by play().
+A board created from a configuration b has no last move; its lines are all checked, once.'''
+
+  __slots__ = ('m', 'n', 'k', 'last')
+
+  # (m, n) -> {transform : weight in encode() of every position, in row-major order}, see canonical()
+  _pows = {}
+
+  def __init__(self, b=None, e=' ', p1=Board.default_p1, p2=Board.default_p2, it=0, m=3, n=3, k=3):
+    '''New board.  If b is None, start with an empty m x n board; otherwise the size is the size of b.'''
+    self.e = e
+    self.p1 = p1
+    self.p2 = p2
+    if b == None: b = tuple((e,)*n for i in range(0, m))
+    self.b = b
+    self.m = len(b)
+    self.n = len(b[0])
+    self.k = k
+    self.it = it
+    self.last = None
+    if stats != None: stats.boards += 1
+
+  def _child(self, b, last):
+    '''Board with configuration b, reached from this board by playing on last.'''
+    nb = MNKBoard.__new__(MNKBoard)
+    nb.e = self.e
+    nb.p1 = self.p1
+    nb.p2 = self.p2
+    nb.b = b
+    nb.m = self.m
+    nb.n = self.n
+    nb.k = self.k
+    nb.it = self.it + 1
+    nb.last = last
+    nb._empty = self._count_empty() - 1
+    if stats != None: stats.boards += 1
+    return nb
+
+  def __hash__(self):
+    try: return self._hash
+    except AttributeError: pass
+    h = Board.__hash__(self)
+    # Boards of other sizes or win lengths are other games; 3,3,3 boards are equal to a Board
+    if (self.m, self.n, self.k) != (3, 3, 3): self._hash = hash((self.m, self.n, self.k, h))
+    return self._hash
+
+  def symmetries(self):
+    '''Transforms mapping the board onto itself: all 8 on a square board, those without a quarter turn otherwise.'''
+    return range(0, 8) if self.m == self.n else (0, 2, 4, 6)
+
+  def transform(self, t):
+    cells = [[None]*self.n for i in range(0, self.m)]
+    for i in range(0, self.m):
+      for j in range(0, self.n):
+        ti, tj = transform_move((i,j), t, self.m, self.n)
+        cells[ti][tj] = self.b[i][j]
+    nb = MNKBoard(tuple(tuple(r) for r in cells), self.e, self.p1, self.p2, self.it, k=self.k)
+    if self.last != None: nb.last = transform_move(self.last, t, self.m, self.n)
+    return nb
+
+  def canonical(self):
+    '''Same as Board.canonical(); moves on c map back to moves on this board through transform_move(move, INVERSE[t], m, n).'''
+    try: pows = MNKBoard._pows[(self.m, self.n)]
+    except KeyError:
+      size = self.m * self.n
+      pows = {}
+      for t in self.symmetries():
+        moved = [transform_move((i,j), t, self.m, self.n) for i in range(0, self.m) for j in range(0, self.n)]
+        pows[t] = tuple(3**(size - 1 - self.n*i - j) for i,j in moved)
+      MNKBoard._pows[(self.m, self.n)] = pows
+    map_val = {self.e : 0, self.p1 : 1, self.p2 : 2}
+    cells = [map_val[el] for r in self.b for el in r]
+    code, t = min((sum(d*p for d,p in zip(cells, pows[t])), t) for t in pows)
+    if t == 0: return (self, 0)
+    return (self.transform(t), t)
+
+  def play(self, i, j=0):
+    if type(i) == list or type(i) == tuple:
+      j = i[1]
+      i = i[0]
+    player = self.next_player()
+    if player == None:
+      raise RuntimeWarning("Function play() was called on a game that is over.")
+    if self.b[i][j] != self.e:
+      raise RuntimeWarning("Board not empty at position (%d,%d)" % (i,j))
+    r = self.b[i]
+    return self._child(self.b[:i] + (r[:j] + (player,) + r[j+1:],) + self.b[i+1:], (i,j))
+
+  def _find_winner(self):
+    if self.last != None:
+      cells = (self.last,)
+    else:
+      cells = [(i,j) for i in range(0, self.m) for j in range(0, self.n) if self.b[i][j] != self.e]
+    for i,j in cells:
+      if self._wins(i, j): return self.b[i][j]
+    return None
+
+  def _wins(self, i, j, p=None):
+    '''True if the mark at (i,j), or a mark of p placed there, is part of k marks in a line.'''
+    if p == None: p = self.b[i][j]
+    for di,dj in ((0,1), (1,0), (1,1), (1,-1)):
+      count = 1
+      for s in (1, -1):
+        r, c = i + s*di, j + s*dj
+        while count < self.k and 0 <= r < self.m and 0 <= c < self.n and self.b[r][c] == p:
+          count += 1
+          r, c = r + s*di, c + s*dj
+      if count >= self.k: return True
+    return False
+
+  def get_empty_idxs(self):
+    return [(i,j) for i in range(0, self.m) for j in range(0, self.n) if self.b[i][j] == self.e]
+
+  def _decoded(self, b, it):
+    return MNKBoard(b, self.e, self.p1, self.p2, it, k=self.k)
+
+  def winning_squares(self, p):
+    # Lines are too many on large boards to keep an index: look around each empty position
+    if p != self.p1 and p != self.p2: return []
+    return [(i,j) for i,j in self.get_empty_idxs() if self._wins(i, j, p)]
+
+  def open_lines(self, p):
+    if p == self.p1: adv = self.p2
+    elif p == self.p2: adv = self.p1
+    else: return 0
+    count = 0
+    for di,dj in ((0,1), (1,0), (1,1), (1,-1)):
+      for i in range(0, self.m):
+        for j in range(0, self.n):
+          # The line of k positions starting at (i,j) in direction (di,dj)
+          ei, ej = i + (self.k - 1)*di, j + (self.k - 1)*dj
+          if not (0 <= ei < self.m and 0 <= ej < self.n): continue
+          if all(self.b[i + s*di][j + s*dj] != adv for s in range(0, self.k)): count += 1
+    return count
+
+def _expand_codes(cls, kwargs, codes):
+  '''Return the set of the codes of the children of the boards with codes, boards like cls(**kwargs).
+Used by Board.enum_confs(), in the worker processes.'''
+  root = cls(**kwargs)
+  size = root.m * root.n
+  pows = [3**(size - 1 - k) for k in range(0, size)] # Weight in the code of each position, in row-major order
+  children = set()
+  for code in codes:
+    # Children are added by their codes: cheaper than making the boards, whose status would need checking
+    b = root.decode(code)
+    if b.is_over(): continue
+    digit = 1 if b.next_player() == b.p1 else 2
+    for i,j in b.get_empty_idxs():
+      children.add(code + digit * pows[root.n*i + j])
+  return children
+
+
 class AbsPlayer(metaclass=abc.ABCMeta):
   name = "Abstract player"
 
@@ -163,6 +807,12 @@ class AbsPlayer(metaclass=abc.ABCMeta):
   def play(self, b):
     raise NotImplementedError('Must first implement abstract methods before using it')
 
+  def play_batch(self, bs, keys=None):
+    '''Return the moves on boards bs, each from a different game, as play() would return them one at a time.
+keys, if set, names the game of each board, for players that keep state during a game: a key stands for the
+same game until start() is called again.  By default, play() is called on each board.'''
+    return [self.play(b) for b in bs]
+
 def get_input(validate, default, message, err_message):
   '''Read inputs from the user:
 validate: a function that takes a string and attempts to transform it into a value in an expected type, and then check if the value is in an expected range.  If so, return the transformed/validated value
@@ -200,9 +850,14 @@ class TerminalPlayer(AbsPlayer):
 
 class Game():
 
-  def __init__(self, p1, p2):
-    self.b = Board()
+  def __init__(self, p1, p2, b=None, log=None):
+    '''New game between players p1 and p2, starting from board b (an empty Board by default).
+If log is set (e.g. a ttt_log.GameLog), log.write(game) is called when the game ends.'''
+    if b == None: b = Board()
+    self.b = b
     self.ps = (p1,p2)
+    self.log = log
+    self.moves = []
 
   def start(self, verbose=False):
     self.ps[0].start()
@@ -210,14 +865,21 @@ class Game():
     it = 0
     if verbose: print(self.b);print()
     while not self.b.is_over():
-      (r,c) = self.ps[it % 2].play(self.b)
+      if stats == None:
+        (r,c) = self.ps[it % 2].play(self.b)
+      else:
+        t = time.perf_counter()
+        (r,c) = self.ps[it % 2].play(self.b)
+        stats.move('%s (%s)' % (self.ps[it % 2].name, self.b.next_player()), time.perf_counter() - t)
       try:
         self.b = self.b.play(r,c)
+        self.moves.append((r,c))
         if verbose: print(self.b);print()
       except RuntimeWarning as e:
         print(e)
         continue
       it = it + 1
+    if self.log != None: self.log.write(self)
 
   def __str__(self):
     string = "%s\n" % self.b
@@ -232,6 +894,53 @@ class Game():
     return string
 
 
+class GamePool():
+  '''Many games between the same two players, played together: at every step, the boards of all the games where
+a player is to move are passed to its play_batch() at once.'''
+
+  def __init__(self, p1, p2, n, b=None, log=None):
+    '''n games between players p1 and p2, each starting from board b (an empty Board by default).
+If log is set, log.write(game) is called as each game ends.'''
+    self.ps = (p1,p2)
+    self.games = [Game(p1, p2, b) for idx in range(0, n)]
+    self.log = log
+
+  def start(self):
+    '''Play all the games to the end.  Return the number of calls to play_batch().'''
+    self.ps[0].start()
+    self.ps[1].start()
+    pending = [idx for idx,g in enumerate(self.games) if not g.b.is_over()]
+    batches = 0
+    while pending:
+      # Game.start() lets ps[0] play the first move
+      turns = ([idx for idx in pending if len(self.games[idx].moves) % 2 == 0],
+               [idx for idx in pending if len(self.games[idx].moves) % 2 == 1])
+      still = []
+      for turn,idxs in enumerate(turns):
+        if idxs == []: continue
+        p = self.ps[turn]
+        bs = [self.games[idx].b for idx in idxs]
+        if stats == None:
+          moves = p.play_batch(bs, idxs)
+        else:
+          t = time.perf_counter()
+          moves = p.play_batch(bs, idxs)
+          t = (time.perf_counter() - t) / len(bs)
+          for b in bs: stats.move('%s (%s)' % (p.name, b.next_player()), t)
+        batches += 1
+        for idx,(r,c) in zip(idxs, moves):
+          g = self.games[idx]
+          try:
+            g.b = g.b.play(r,c)
+            g.moves.append((r,c))
+          except RuntimeWarning as e:
+            print(e)
+          if not g.b.is_over(): still.append(idx)
+          elif self.log != None: self.log.write(g)
+      pending = sorted(still)
+    return batches
+
+
 import ttt_player
 
 def main(argv):
@@ -240,7 +949,9 @@ def main(argv):
               ttt_player.DPlayer, 
               ttt_player.ADPlayer,
               ttt_player.DRPlayer,
-              ttt_player.RLPlayer )
+              ttt_player.RLPlayer,
+              ttt_player.NegamaxPlayer,
+              ttt_player.MCTSPlayer )
   validate_func = lambda v: int(v) if int(v) in range(0,len(options)) else int('raise value error')
   for idx,o in enumerate(options):
     print("%d %s" % (idx, o.name))
@@ -0,0 +1,160 @@
+__author__ ="Daniel S. Fava"
+__license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
+__year__   ="2018"
+
+import sys
+import time
+
+import numpy as np
+
+import ttt
+
+# Positions k=3*i+j of the 8 lines of the board
+LINES = np.array(((0,1,2), (3,4,5), (6,7,8),  # Rows
+                  (0,3,6), (1,4,7), (2,5,8),  # Columns
+                  (0,4,8), (2,4,6)))          # Diagonals
+# _LINE_CELLS[3*l+n, k] is 1 if the n-th position of line l is k
+_LINE_CELLS = (LINES.reshape(-1, 1) == np.arange(0, 9)).astype(np.int8)
+# _DIGITS[code] are the cells of the board with code (see Board.encode())
+_DIGITS = (np.arange(0, 3**9).reshape(-1, 1) // 3**np.arange(8, -1, -1) % 3).astype(np.int8)
+
+class BoardBatch():
+  '''N boards stored as an (N, 9) int8 array: 0 for an empty position, 1 for player p1, and 2 for player p2.
+Position (i,j) of a board is column 3*i+j.  Players are numbered 1 and 2 throughout, with 0 meaning nobody.
+Like Board, a batch is not modified by play(), which returns a new batch.'''
+
+  def __init__(self, cells, it=None):
+    '''New batch from an (N, 9) array of cells.  it, the iteration of each game, defaults to the number of marks.'''
+    self.cells = np.asarray(cells, dtype=np.int8)
+    self.it = np.count_nonzero(self.cells, axis=1) if it is None else np.asarray(it)
+
+  @classmethod
+  def empty(cls, n):
+    return cls(np.zeros((n, 9), dtype=np.int8))
+
+  @classmethod
+  def from_boards(cls, bs):
+    return cls(_DIGITS[[b.encode() for b in bs]], [b.it for b in bs])
+
+  def to_boards(self, e=' ', p1=ttt.Board.default_p1, p2=ttt.Board.default_p2):
+    marks = (e, p1, p2)
+    return [ttt.Board(tuple(tuple(marks[v] for v in row[3*i:3*i+3]) for i in range(0,3)), e, p1, p2, int(it))
+            for row,it in zip(self.cells.tolist(), self.it)]
+
+  def __len__(self):
+    return len(self.cells)
+
+  def who_won(self):
+    '''Return, for each board, the player who won it, 0 if nobody did.'''
+    c = self.cells[:, LINES]
+    won1 = (c == 1).all(axis=2).any(axis=1)
+    won2 = (c == 2).all(axis=2).any(axis=1)
+    return np.where(won1, 1, np.where(won2, 2, 0)).astype(np.int8)
+
+  def is_full(self):
+    return (self.cells != 0).all(axis=1)
+
+  def is_over(self):
+    return self.is_full() | (self.who_won() != 0)
+
+  def next_player(self):
+    '''Return, for each board, the player who plays next, 0 if the game is over.'''
+    return np.where(self.is_over(), 0, 1 + self.it % 2).astype(np.int8)
+
+  def legal_moves(self):
+    '''Return an (N, 9) bool array, true for the positions where the next player may play.'''
+    return (self.cells == 0) & ~self.is_over()[:, None]
+
+  def winning_squares(self, p):
+    '''Return an (N, 9) bool array, true for the empty positions that complete a line of player p[n] on board n.
+p is a player number or an array with one player per board.'''
+    p = np.broadcast_to(np.asarray(p, dtype=np.int8), (len(self),))
+    c = self.cells[:, LINES]
+    hot = ((c == p[:, None, None]).sum(axis=2) == 2) & ((c == 0).sum(axis=2) == 1)
+    squares = (c == 0) & hot[:, :, None]
+    return (squares.reshape(len(self), -1).astype(np.int8) @ _LINE_CELLS) > 0
+
+  def play(self, moves):
+    '''Return a new batch where the next player of board n played on position moves[n].
+Boards with a negative move are left as they are.'''
+    moves = np.asarray(moves)
+    n = np.nonzero(moves >= 0)[0]
+    legal = self.legal_moves()[n, moves[n]]
+    if not legal.all():
+      raise RuntimeWarning("Illegal move on board %d." % n[np.argmin(legal)])
+    cells = self.cells.copy()
+    it = self.it.copy()
+    cells[n, moves[n]] = 1 + it[n] % 2
+    it[n] += 1
+    return BoardBatch(cells, it)
+
+def random_moves(batch, rng):
+  '''For each board, a random legal move, -1 if the game is over.'''
+  legal = batch.legal_moves()
+  scores = np.where(legal, rng.random(legal.shape), -1.0)
+  return np.where(legal.any(axis=1), scores.argmax(axis=1), -1)
+
+def defenses(batch, p=0):
+  '''For each board, the move of ttt_player.defend_move(): block a square where the adversary could win on its
+next move.  -1 if there is no such threat, or if the adversary is player p (a player number, or one per board).
+The block is the first adversary's win among the grandchildren of the board, in order of the empty positions:
+it is found only after a move m of ours that neither wins nor fills the board, and it cannot be m.'''
+  rows = np.arange(0, len(batch))
+  me = batch.next_player()
+  adv = np.where(me == 0, 0, 3 - me)
+  threats = batch.winning_squares(adv)
+  empty = batch.cells == 0
+  ours = empty & ~batch.winning_squares(me) & (empty.sum(axis=1) >= 2)[:, None]
+  has_m = ours.any(axis=1)
+  m = ours.argmax(axis=1) # Our first move that is followed by an adversary's move
+  blocks = threats.copy()
+  blocks[rows, m] = False
+  ours[rows, m] = False
+  # If the only threat is on m, our next move (if any) lets the adversary play there
+  defend = has_m & (blocks.any(axis=1) | threats.any(axis=1) & ours.any(axis=1)) & (adv != p)
+  move = np.where(blocks.any(axis=1), blocks.argmax(axis=1), m)
+  return np.where(defend, move, -1)
+
+def wins(batch, p):
+  '''For each board, the first position where player p (a player number, or one per board) wins if p is to move,
+-1 otherwise.'''
+  me = batch.next_player()
+  squares = batch.winning_squares(me)
+  return np.where((me != 0) & (me == p) & squares.any(axis=1), squares.argmax(axis=1), -1)
+
+def defend_moves(batch, rng):
+  '''For each board, the move ttt_player.DPlayer would make: a defense (see defenses()), otherwise a random move.
+-1 if the game is over.'''
+  moves = defenses(batch)
+  return np.where(moves >= 0, moves, random_moves(batch, rng))
+
+policies = {'random' : random_moves, 'defend' : defend_moves}
+
+def play_games(n, p1='random', p2='random', rng=None):
+  '''Play n games in lockstep, player p1 using policy p1 and player p2 using policy p2 (keys of policies).
+Return the batch of final boards.'''
+  if rng is None: rng = np.random.default_rng()
+  batch = BoardBatch.empty(n)
+  for it in range(0, 9):
+    me = batch.next_player()
+    if not me.any(): break
+    moves = policies[p1](batch, rng)
+    if p2 != p1: moves = np.where(me == 1, moves, policies[p2](batch, rng))
+    batch = batch.play(np.where(me == 0, -1, moves))
+  return batch
+
+def main(argv):
+  n = int(argv[1]) if len(argv) > 1 else 100000
+  rng = np.random.default_rng(0)
+  for p1 in policies:
+    for p2 in policies:
+      t = time.perf_counter()
+      w = play_games(n, p1, p2, rng).who_won()
+      t = time.perf_counter() - t
+      print('%-6s vs %-6s %s, %.0f games per minute' % (p1, p2,
+          {None : int((w == 0).sum()), ttt.Board.default_p1 : int((w == 1).sum()), ttt.Board.default_p2 : int((w == 2).sum())},
+          n / t * 60))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
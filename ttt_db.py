@@ -0,0 +1,136 @@
+'''Database of solved tic-tac-toe states.
+
+The database is a binary file holding one record per board configuration,
+indexed by the base-3 code of the board (see Board.encode()), so a lookup is a
+single offset computation.  Records of unreachable configurations are zeroed.
+
+File layout (little endian):
+  header: magic b'TTTD', format version (uint16), record size (uint16), number of records (uint32)
+  records: for every code in [0, 3**9)
+    number of descendants won by nobody, by p1 and by p2 (3 x uint16)
+    game-theoretic value under perfect play: 1 if p1 wins, -1 if p2 wins, 0 otherwise (int8)
+    index 3*i+j of a best move for the player to move, -1 if the game is over (int8)
+Descendants include the board itself, as in Board.get_descendants().
+'''
+
+__author__ ="Daniel S. Fava"
+__license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
+__year__   ="2018"
+
+import os
+import mmap
+import struct
+
+VERSION = 1
+MAGIC = b'TTTD'
+HEADER = struct.Struct('<4sHHI')
+RECORD = struct.Struct('<HHHbb')
+NUM_RECORDS = 3**9
+
+def default_path():
+  '''Path of the database: $TTT_DB if set, else ttt.db next to this module.'''
+  return os.environ.get('TTT_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ttt.db'))
+
+def compatible(b):
+  '''True if board b can be looked up in the database, i.e. it is a 3x3 board, won with 3 in a line, with the default marks.'''
+  return isinstance(b, ttt.Board) and (b.m, b.n, b.k) == (3, 3, 3) and \
+      b.e == ' ' and b.p1 == ttt.Board.default_p1 and b.p2 == ttt.Board.default_p2
+
+def build():
+  '''Solve every configuration reachable from the empty board, return the content of the database file.'''
+  bs = ttt.BitBoard().get_descendants()
+  # Bottom-up over the game DAG: children are played one move later than their parents
+  bs.sort(key=lambda b: -b.it)
+  counter = ttt.OutcomeCounter()
+  value = {}
+  best = {}
+  for b in bs:
+    code = b.encode()
+    w = b.who_won()
+    if b.is_over():
+      value[code] = 1 if w == b.p1 else -1 if w == b.p2 else 0
+      best[code] = -1
+      continue
+    sign = 1 if b.next_player() == b.p1 else -1
+    value[code] = -2
+    for idx,c in zip(b.get_empty_idxs(), b.iter_children()):
+      cc = c.encode()
+      if sign * value[cc] > sign * value[code] or value[code] == -2:
+        value[code] = value[cc]
+        best[code] = 3*idx[0] + idx[1]
+  data = bytearray(HEADER.size + NUM_RECORDS * RECORD.size)
+  HEADER.pack_into(data, 0, MAGIC, VERSION, RECORD.size, NUM_RECORDS)
+  for b in bs:
+    hist = counter.count(b)
+    RECORD.pack_into(data, HEADER.size + b.encode() * RECORD.size, hist[None], hist[b.p1], hist[b.p2],
+                     value[b.encode()], best[b.encode()])
+  return bytes(data)
+
+def write(path=None):
+  '''Build the database and write it to path (default_path() by default).  Return the content of the file.'''
+  if path == None: path = default_path()
+  data = build()
+  tmp = '%s.%d.tmp' % (path, os.getpid())
+  with open(tmp, 'wb') as f:
+    f.write(data)
+  os.replace(tmp, path)
+  return data
+
+def valid(data):
+  '''True if data starts with a header matching this version of the format.'''
+  if len(data) < HEADER.size: return False
+  header = HEADER.unpack_from(data, 0)
+  return header == (MAGIC, VERSION, RECORD.size, NUM_RECORDS) and \
+      len(data) == HEADER.size + NUM_RECORDS * RECORD.size
+
+class SolvedDB():
+
+  def __init__(self, data):
+    '''Wrap the content of a database file: bytes or a memory map.'''
+    if not valid(data): raise ValueError("Invalid tic-tac-toe database.")
+    self.data = data
+
+  def _record(self, b):
+    return RECORD.unpack_from(self.data, HEADER.size + b.encode() * RECORD.size)
+
+  def hist(self, b):
+    '''Return {None : n, p1 : n, p2 : n}, the number of descendants of b won by each player.
+The counts are all zero if b is not reachable from the empty board.'''
+    r = self._record(b)
+    return {None : r[0], b.p1 : r[1], b.p2 : r[2]}
+
+  def value(self, b):
+    '''Winner of b under perfect play, None for a cat's game.'''
+    v = self._record(b)[3]
+    return b.p1 if v == 1 else b.p2 if v == -1 else None
+
+  def best_move(self, b):
+    '''A best move (i,j) in b for the player to move, None if the game is over.'''
+    k = self._record(b)[4]
+    return None if k == -1 else (k // 3, k % 3)
+
+def load(path=None, rebuild=False, save=True):
+  '''Memory-map the database at path (default_path() by default).  Return None if the file is missing or has the
+wrong format, unless rebuild is true: then rebuild it, and write it to path if save is true.  The database is kept
+in memory if it is not saved, or if the file cannot be written.'''
+  if path == None: path = default_path()
+  try:
+    with open(path, 'rb') as f:
+      data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if valid(data): return SolvedDB(data)
+    data.close()
+  except (OSError, ValueError):
+    pass
+  if not rebuild: return None
+  if not save: return SolvedDB(build())
+  try:
+    data = write(path)
+  except OSError:
+    data = build()
+  return SolvedDB(data)
+
+# Imported last: ttt imports ttt_player, which imports this module
+import ttt
+
+if __name__ == "__main__":
+  write()
@@ -0,0 +1,162 @@
+'''Append-only binary log of finished games.
+
+A log is a header followed by a stream of records of two kinds:
+  config: byte 0xE0, length n (uint16, little endian), n bytes of JSON:
+          the list of the two players as [class name, mark, params], the first player first.
+          The config applies to the games that follow it, up to the next config.
+  game:   the moves, one 4-bit cell each (3*i+j), then a result cell: 0xA for no winner,
+          0xB if the first player won, 0xC if the second player won.  Cells are packed two
+          per byte, high cell first, and a result in a high cell is padded with 0xF.
+          A game of 9 moves takes 5 bytes.
+Only games of 3x3 boards started from the empty board can be logged.
+
+The header is magic b'TTTL' and the format version (uint16).
+'''
+
+__author__ ="Daniel S. Fava"
+__license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
+__year__   ="2018"
+
+import sys
+import json
+import struct
+import collections
+
+VERSION = 1
+MAGIC = b'TTTL'
+HEADER = struct.Struct('<4sH')
+CONFIG = 0xE0
+NO_WINNER, FIRST_WON, SECOND_WON = 0xA, 0xB, 0xC
+PAD = 0xF
+
+LoggedGame = collections.namedtuple('LoggedGame', ('players', 'moves', 'winner'))
+
+_MOVES = tuple((k // 3, k % 3) for k in range(0, 9))
+# Byte -> (moves in the byte, result or None if the game goes on in the next byte)
+_DECODE = tuple((tuple(c for c in (b >> 4, b & 0xF)[:1 if b >> 4 >= NO_WINNER else 2] if c < 9),
+                 b >> 4 if b >> 4 >= NO_WINNER else (b & 0xF) if (b & 0xF) >= NO_WINNER else None)
+                for b in range(0, 256))
+
+def player_config(player):
+  '''[class name, mark, params] of player, as stored in a config record.'''
+  return [type(player).__name__, player.p, getattr(player, 'params', None)]
+
+_HEX = {(k // 3, k % 3) : '%x' % k for k in range(0, 9)}
+
+def pack_game(moves, result):
+  '''Record of a game with moves, a list of moves (i,j), and result (NO_WINNER, FIRST_WON or SECOND_WON).'''
+  cells = ''.join([_HEX[m] for m in moves]) + '%x' % result
+  if len(cells) % 2: cells += '%x' % PAD
+  return bytes.fromhex(cells)
+
+class GameLog():
+  '''Writer of a game log.  Games are buffered; the log is complete once closed.'''
+
+  def __init__(self, f, header=True):
+    '''Append to f, a path or a binary file.  If header is true, a header is written if the log is empty;
+without a header, the records can be added to another log by extend().'''
+    self.own = isinstance(f, str)
+    if self.own: f = open(f, 'ab')
+    self.f = f
+    if header and f.tell() == 0: f.write(HEADER.pack(MAGIC, VERSION))
+    self.config = None # JSON of the config in force
+    self.players = None # Players the config was made from
+    self.games = 0
+
+  def append(self, players, moves, winner):
+    '''Log a game between players, a list [class name, mark, params] for each player, the first player first.
+moves is the list of moves (i,j), and winner the mark of the winner, None for no winner.
+A config record is written when players changes; players is compared by identity first, so pass a new list
+rather than modifying the one passed before.'''
+    if players is not self.players or self.config == None:
+      config = json.dumps(players, sort_keys=True).encode()
+      if config != self.config:
+        self.f.write(bytes((CONFIG,)) + struct.pack('<H', len(config)) + config)
+        self.config = config
+      self.players = players
+    if winner == None: result = NO_WINNER
+    elif winner == players[0][1]: result = FIRST_WON
+    elif winner == players[1][1]: result = SECOND_WON
+    else: raise ValueError("Winner %s is not one of the players." % winner)
+    self.f.write(pack_game(moves, result))
+    self.games += 1
+
+  def write(self, game):
+    '''Log ttt.Game game, which must have started from the empty 3x3 board.'''
+    b = game.b
+    if (b.m, b.n, b.k) != (3, 3, 3) or b.it != len(game.moves):
+      raise ValueError("Only games of 3x3 boards started from the empty board can be logged.")
+    self.append([player_config(game.ps[0]), player_config(game.ps[1])], game.moves, b.who_won())
+
+  def extend(self, data):
+    '''Append records written by another GameLog, e.g. in another process, without their header.'''
+    self.f.write(data)
+    self.config = None # data may have changed the config in force
+
+  def close(self):
+    if self.own: self.f.close()
+    else: self.f.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def read(path, chunk=1 << 16):
+  '''Generator of the games in the log at path, as LoggedGame tuples (players, moves, winner).
+The file is read chunk bytes at a time; games with the same config share the same players list.'''
+  with open(path, 'rb') as f:
+    if f.read(HEADER.size) != HEADER.pack(MAGIC, VERSION):
+      raise ValueError("%s is not a game log of version %d." % (path, VERSION))
+    players = None
+    buf = b''
+    pos = 0
+    while True:
+      data = f.read(chunk)
+      if not data: break
+      buf = buf[pos:] + data
+      pos = 0
+      n = len(buf)
+      while pos < n:
+        if buf[pos] == CONFIG:
+          if pos + 3 > n: break
+          length = buf[pos+1] | (buf[pos+2] << 8)
+          if pos + 3 + length > n: break
+          players = json.loads(buf[pos+3:pos+3+length])
+          pos += 3 + length
+          continue
+        moves = []
+        end = pos
+        result = None
+        while end < n:
+          cells, result = _DECODE[buf[end]]
+          moves.extend(cells)
+          end += 1
+          if result != None: break
+        if result == None: break # The game goes on in the next chunk
+        if players == None: raise ValueError("%s has a game before any config." % path)
+        pos = end
+        winner = None if result == NO_WINNER else players[0][1] if result == FIRST_WON else players[1][1]
+        yield LoggedGame(players, tuple(_MOVES[k] for k in moves), winner)
+    if pos < len(buf): raise ValueError("%s ends with an incomplete record." % path)
+
+def summarize(path):
+  '''Return {(first player, second player) : {winner : games}}, players being class names.'''
+  res = {}
+  for g in read(path):
+    key = (g.players[0][0], g.players[1][0])
+    tally = res.setdefault(key, {})
+    tally[g.winner] = tally.get(g.winner, 0) + 1
+  return res
+
+def main(argv):
+  if len(argv) != 2:
+    print('Usage: %s <log>' % argv[0])
+    return 1
+  for (p1, p2), tally in sorted(summarize(argv[1]).items()):
+    print('%s, %s vs %s' % (tally, p1, p2))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
@@ -2,16 +2,116 @@ __author__ ="Daniel S. Fava"
 __license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
 __year__   ="2018"
 
+import math
+import time
+import atexit
 import random
+import pickle
+import collections
+import concurrent.futures
 
 import ttt
+import ttt_db
+import ttt_values
+try:
+  import ttt_batch
+except ImportError: # numpy is missing: batches of boards are looked at one board at a time
+  ttt_batch = None
+
+# Smallest batch of boards given to ttt_batch: on fewer boards, numpy costs more than it saves
+BATCH_MIN = 128
+
+_db = False # The solved-state database, once looked for by solved_db()
+
+def solved_db(build=False, save=True):
+  '''The solved-state database (see ttt_db), memory-mapped on first use.  None if there is no database file,
+unless build is true: then it is built, and written for the next time if save is true.  Build it with
+python ttt_db.py.'''
+  global _db
+  if _db is False or (_db == None and build): _db = ttt_db.load(rebuild=build, save=save)
+  return _db
 
 def get_play_from_parent_and_child(p, c):
-  for i in range(0,3):
-    for j in range(0,3):
-      if p.b[i][j] != c.b[i][j]: return (i,j)
+  for i,r in enumerate(p.b):
+    for j,el in enumerate(r):
+      if el != c.b[i][j]: return (i,j)
   assert(0)
 
+def lookup_moves(tables, bs, move):
+  '''Return move(b) for each of boards bs, looked up by board code (see Board.encode()) in tables, (e, p1, p2, parity
+of it) -> bytearray of moves 3*i+j by code, as in TablePlayer.  move() is called once per 3x3 board missing from its
+table, and on every board of another size.  For players whose moves depend only on the board.'''
+  res = []
+  key = table = None
+  for b in bs:
+    if (b.m, b.n, b.k) != (3, 3, 3):
+      res.append(move(b))
+      continue
+    if (b.e, b.p1, b.p2, b.it % 2) != key:
+      key = (b.e, b.p1, b.p2, b.it % 2) # The parity of it tells the player to move
+      table = tables.get(key)
+      if table == None: table = tables[key] = bytearray([TablePlayer.NO_MOVE]) * 3**9
+    code = b.encode()
+    k = table[code]
+    if k == TablePlayer.NO_MOVE:
+      m = move(b)
+      k = table[code] = 3*m[0] + m[1]
+    res.append(_MOVES[k])
+  return res
+
+_MOVES = tuple((k // 3, k % 3) for k in range(0, 9)) # Moves by table entry, see lookup_moves()
+
+def defend_move(b, p, win=False):
+  '''Move on b that stops the adversary of p from winning on its next move, None if there is no such threat.
+The move is the first adversary's win found among the grandchildren of b, in order, but the grandchildren
+are not made: after a move m of ours that neither wins nor fills the board, the adversary wins on any of
+its winning squares (see Board.winning_squares()) but m.
+If win is true and p is to move, the first square where p wins comes first.'''
+  me = b.next_player()
+  if me == None: return None
+  if win and me == p:
+    wins = b.winning_squares(p)
+    if wins != []: return wins[0]
+  adv = b.p2 if me == b.p1 else b.p1
+  if adv == p: return None # The grandchildren are won by p, if at all
+  threats = b.winning_squares(adv)
+  if threats == []: return None
+  empty = b.get_empty_idxs()
+  if len(empty) < 2: return None # Our move fills the board
+  wins = b.winning_squares(me)
+  for m in empty:
+    if m in wins: continue # Our move wins: the game ends
+    for t in threats:
+      if t != m: return t # The adversary can win if we play m: try to defend
+  return None
+
+def defend_moves(bs, p, win=False):
+  '''defend_move(b, p, win) for each of boards bs.  With numpy, batches of 3x3 boards are looked at all at once,
+see ttt_batch.defenses().'''
+  if ttt_batch == None or len(bs) < BATCH_MIN or any((b.m, b.n, b.k) != (3, 3, 3) for b in bs):
+    return [defend_move(b, p, win) for b in bs]
+  batch = ttt_batch.BoardBatch.from_boards(bs)
+  ps = [1 if p == b.p1 else 2 if p == b.p2 else 0 for b in bs] # Number of p on each board
+  moves = ttt_batch.defenses(batch, ps).tolist()
+  if win: moves = [w if w >= 0 else m for w,m in zip(ttt_batch.wins(batch, ps).tolist(), moves)]
+  return [None if k < 0 else _MOVES[k] for k in moves]
+
+def get_descendant_stats(c):
+  '''Return the fraction of descendants of c (c included) won by each player, and by None.
+Looks c up in the solved-state database when possible; otherwise, uses the memoized Board.outcome_counts().'''
+  stats = {c.p1 : 0.0, c.p2 : 0.0, None : 0.0}
+  db = solved_db()
+  hist = db.hist(c) if db != None and ttt_db.compatible(c) else None
+  if hist == None or sum(hist.values()) == 0:
+    hist = c.outcome_counts()
+  for w in hist:
+    stats[w] += hist[w]
+  total = stats[None] + stats[c.p1] + stats[c.p2]
+  stats[None] = stats[None] / total
+  stats[c.p1] = stats[c.p1] / total
+  stats[c.p2] = stats[c.p2] / total
+  return stats
+
 class APlayer(ttt.AbsPlayer):
   '''
 Algorithm:
@@ -31,22 +131,21 @@ the player does not play defensively when it is about to lose.
   def __init__(self, p, params=None):
     self.p = p
     if params != None: raise ValueError("Player does not take parameters.")
+    self.move_tables = {} # Moves by board code, see lookup_moves()
 
   def start(self):
     pass
 
   def play(self,b):
+    return lookup_moves(self.move_tables, [b], self.attack)[0]
+
+  def play_batch(self, bs, keys=None):
+    return lookup_moves(self.move_tables, bs, self.attack)
+
+  def attack(self,b):
     stats = {}
-    cs = b.get_children()
-    for c in cs:
-      stats[c] = {b.p1 : 0.0, b.p2 : 0.0, None : 0.0}
-      ds = c.get_descendants()
-      for d in ds:
-        stats[c][d.who_won()] += 1
-      total = stats[c][None] + stats[c][b.p1] + stats[c][b.p2]
-      stats[c][None] = stats[c][None] / total
-      stats[c][b.p1] = stats[c][b.p1] / total
-      stats[c][b.p2] = stats[c][b.p2] / total
+    for c in b.iter_children():
+      stats[c] = get_descendant_stats(c)
     best_score = -float("inf")
     best_board = None
     for el in stats:
@@ -73,17 +172,16 @@ else, play randomly.
     pass
 
   def play(self,b):
-    cs = b.get_children()
     # Must we need to defend now?
-    for c in cs:
-      gcs = c.get_children() # grand-children
-      for gc in gcs:
-        if gc.who_won() != None and gc.who_won() != self.p:
-          # The adversary can win if we play according to c
-          # Try to defend
-          return get_play_from_parent_and_child(c,gc)
+    move = defend_move(b, self.p)
+    if move != None: return move
     return random.choice(b.get_empty_idxs())
 
+  def play_batch(self, bs, keys=None):
+    # Random moves are drawn for every board without a defense, in order
+    defenses = defend_moves(bs, self.p)
+    return [move if move != None else random.choice(b.get_empty_idxs()) for b,move in zip(bs, defenses)]
+
 
 class ADPlayer(ttt.AbsPlayer):
   '''
@@ -98,35 +196,27 @@ the largest number of winning descendants.
   def __init__(self, p, params=None):
     self.p = p
     if params != None: raise ValueError("Player does not take parameters.")
+    self.move_tables = {} # Moves of attack() by board code, see lookup_moves()
 
   def start(self):
     pass
 
   def play(self,b):
+    # Can we win on the next move?  Must we need to defend now?
+    move = defend_move(b, self.p, win=True)
+    if move != None: return move
+    return lookup_moves(self.move_tables, [b], self.attack)[0]
+
+  def play_batch(self, bs, keys=None):
+    moves = defend_moves(bs, self.p, win=True)
+    attacks = iter(lookup_moves(self.move_tables, [b for b,move in zip(bs, moves) if move == None], self.attack))
+    return [move if move != None else next(attacks) for move in moves]
+
+  def attack(self,b):
+    # Play on the square with largest fraction of winning descendants
     stats = {}
-    cs = b.get_children()
-    # Can we win on the next move?
-    for c in cs:
-      if c.who_won() == self.p:
-        return get_play_from_parent_and_child(b,c)
-    # Must we need to defend now?
-    for c in cs:
-      gcs = c.get_children() # grand-children
-      for gc in gcs:
-        if gc.who_won() != None and gc.who_won() != self.p:
-          # The adversary can win if we play according to c
-          # Try to defend
-          return get_play_from_parent_and_child(c,gc)
-    # Otherwise, play on the square with largest fraction of winning descendants
-    for c in cs:
-      stats[c] = {b.p1 : 0.0, b.p2 : 0.0, None : 0.0}
-      ds = c.get_descendants()
-      for d in ds:
-        stats[c][d.who_won()] += 1
-      total = stats[c][None] + stats[c][b.p1] + stats[c][b.p2]
-      stats[c][None] = stats[c][None] / total
-      stats[c][b.p1] = stats[c][b.p1] / total
-      stats[c][b.p2] = stats[c][b.p2] / total
+    for c in b.iter_children():
+      stats[c] = get_descendant_stats(c)
     best_score = -float("inf")
     best_board = None
     for el in stats:
@@ -135,6 +225,52 @@ the largest number of winning descendants.
         best_score = stats[el][self.p]
     return get_play_from_parent_and_child(b,best_board)
 
+class RewardCache():
+  '''Least-recently-used cache of rewards.
+Holds at most maxsize rewards (no limit if maxsize is None), evicting the least recently used one first.'''
+
+  def __init__(self, maxsize=None):
+    self.maxsize = maxsize
+    self.rewards = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    '''Return the reward stored under key; raise KeyError if there is none.'''
+    try:
+      reward = self.rewards[key]
+    except KeyError:
+      self.misses += 1
+      raise
+    self.hits += 1
+    self.rewards.move_to_end(key)
+    return reward
+
+  def put(self, key, reward):
+    self.rewards[key] = reward
+    self.rewards.move_to_end(key)
+    if self.maxsize != None and len(self.rewards) > self.maxsize:
+      self.rewards.popitem(last=False)
+
+  def clear(self):
+    self.rewards.clear()
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    return len(self.rewards)
+
+  def save(self, path):
+    with open(path, 'wb') as f:
+      pickle.dump(dict(self.rewards), f)
+
+  def load(self, path):
+    '''Warm-start the cache with the rewards saved to path by save().'''
+    with open(path, 'rb') as f:
+      rewards = pickle.load(f)
+    for key in rewards:
+      self.put(key, rewards[key])
+
 class DRPlayer(ttt.AbsPlayer):
   '''Applies discount on future rewards for loss/tie/win.'''
 
@@ -167,6 +303,9 @@ class DRPlayer(ttt.AbsPlayer):
                'errmsg' : 'Invalid reward.  Must be a number.  Try again.'},
             }
 
+  # Rewards shared by all instances: players with the same mark and parameters compute each reward once per process
+  cache = RewardCache(maxsize=2**20)
+
   def __init__(self, p, params={}):
     self.p = p
     self.params = {}
@@ -175,16 +314,45 @@ class DRPlayer(ttt.AbsPlayer):
     # If parameters have been passed to constructure, then override the parameter here
     for param in params:
       self.params[param] = params[param]
-    self.rewards = {}
+    self.cache = DRPlayer.cache
+    self.move_tables = {} # Best moves by board code, see lookup_moves()
+    self.table = None # Rewards loaded from a file, see load()
 
   def start(self):
     pass
 
+  def save(self, path, root=None):
+    '''Write the rewards of the boards reachable from root (an empty Board by default) to path, see ttt_values.
+Rewards not computed yet are computed first, so that a player loading the file does not have to.'''
+    if root == None: root = ttt.Board()
+    if (root.m, root.n, root.k) != (3, 3, 3): raise ValueError("Only rewards of 3x3 boards can be saved.")
+    values = {b.encode() : self.compute_reward(b) for b in root.get_descendants(canonical=True)}
+    meta = {'player' : type(self).__name__, 'p' : self.p, 'e' : root.e, 'p1' : root.p1, 'p2' : root.p2,
+            'params' : self.params}
+    ttt_values.write(path, meta, values)
+
+  def load(self, path):
+    '''Use the rewards saved to path by save(), and the parameters they were computed with.'''
+    table = ttt_values.load(path)
+    if table.meta['player'] != type(self).__name__ or table.meta['p'] != self.p:
+      raise ValueError("%s holds rewards of %s %s, not of %s %s." % (path, table.meta['player'], table.meta['p'],
+                       type(self).__name__, self.p))
+    self.params = dict(table.meta['params'])
+    self.table = table
+    self.move_tables = {}
+
   def play(self, b):
+    return lookup_moves(self.move_tables, [b], self.choose)[0]
+
+  def play_batch(self, bs, keys=None):
+    return lookup_moves(self.move_tables, bs, self.choose)
+
+  def choose(self, b):
+    # Rewards are shared by rotations and reflections of a board (see compute_reward()), but the children are
+    # tried in the order of b's own empty positions, so that ties go to the first of them in b
     best_b = None
     best_reward = -float("inf")
-    cs = b.get_children()
-    for c in cs:
+    for c in b.iter_children():
       tmp = self.compute_reward(c)
       if best_reward < tmp:
         best_reward = tmp
@@ -193,21 +361,338 @@ class DRPlayer(ttt.AbsPlayer):
     return get_play_from_parent_and_child(b,best_b)
 
   def compute_reward(self, b):
-    try: return self.rewards[b]  # Try to return a precomputed reward
-    except KeyError: pass # if reward has not been pre-computed, compute it..
-
+    b,_ = b.canonical() # Rotations and reflections of a board have the same reward
     if b.is_over():
       w = b.who_won()
       if w == None: return self.params['tie']
       elif w == self.p: return self.params['win']
       else: return self.params['los']
-    cs = b.get_children()
+    if self.table != None:
+      reward = self.table.get(b)
+      if reward != None: return reward
+    key = (hash(b), b.p1, b.p2, self.p, self.params['dr'], self.params['win'], self.params['tie'], self.params['los'])
+    try:
+      reward = self.cache.get(key)  # Try to return a precomputed reward
+      if ttt.stats != None: ttt.stats.cache('DRPlayer.rewards', True)
+      return reward
+    except KeyError:
+      pass # if reward has not been pre-computed, compute it..
+    if ttt.stats != None: ttt.stats.cache('DRPlayer.rewards', False)
     reward = 0.0;
-    for c in cs:
+    n = 0
+    for c in b.iter_children():
       reward += self.compute_reward(c)
-    reward = reward / len(cs) # reward as the average of children's reward
-    self.rewards[b] = self.params['dr'] * reward
-    return self.rewards[b]
+      n += 1
+    reward = reward / n # reward as the average of children's reward
+    reward = self.params['dr'] * reward
+    self.cache.put(key, reward)
+    return reward
+
+class NegamaxPlayer(ttt.AbsPlayer):
+  '''Perfect player: negamax search with alpha-beta pruning and a transposition table.
+Moves are searched center first, then corners, then edges (on other board sizes, closest to the center first), starting with the best move found in an earlier search.
+With dtm (depth to mate), among moves with the same outcome, prefer the quickest win or the slowest loss.'''
+
+  name = "Negamax (perfect) player"
+
+  params = {'dtm':
+              {'valfun' : lambda v: int(v) if int(v) in [0,1] else int('raise value error'),
+               'def' : 1,
+               'msg' : 'Prefer quick wins and slow losses, 1 for yes and 0 for no, default %d: ',
+               'errmsg' : 'Invalid option.  Must be 0 or 1.  Try again.'},
+            }
+
+  # Squares in the order they are searched
+  order = ((1,1), (0,0), (0,2), (2,0), (2,2), (0,1), (1,0), (1,2), (2,1))
+
+  # Transposition table shared by all instances:
+  # (board, marks, parity of the iteration, dtm) -> (flag, score, best move)
+  EXACT, LOWER, UPPER = 0, 1, 2
+  table = {}
+
+  def __init__(self, p, params={}):
+    self.p = p
+    self.params = {}
+    for param in NegamaxPlayer.params:
+      self.params[param] = NegamaxPlayer.params[param]['def'] # Set params to default
+    for param in params:
+      self.params[param] = params[param]
+    self.move_tables = {} # Moves by board code, see lookup_moves()
+
+  def start(self):
+    pass
+
+  def play(self, b):
+    return lookup_moves(self.move_tables, [b], self.choose)[0]
+
+  def play_batch(self, bs, keys=None):
+    return lookup_moves(self.move_tables, bs, self.choose)
+
+  def choose(self, b):
+    best_score = -float("inf")
+    best_move = None
+    for move in self.ordered_moves(b):
+      score = -self.negamax(b.play(move), -float("inf"), -best_score)
+      if score > best_score:
+        best_score = score
+        best_move = move
+    assert(best_move != None)
+    return best_move
+
+  def ordered_moves(self, b, first=None):
+    if (b.m, b.n) == (3, 3):
+      empty = set(b.get_empty_idxs())
+      moves = [m for m in NegamaxPlayer.order if m in empty and m != first]
+    else:
+      # Closest to the center first
+      center = ((b.m - 1) / 2, (b.n - 1) / 2)
+      moves = sorted((m for m in b.get_empty_idxs() if m != first),
+                     key=lambda m: max(abs(m[0] - center[0]), abs(m[1] - center[1])))
+    if first != None: moves.insert(0, first)
+    return moves
+
+  def negamax(self, b, alpha, beta):
+    '''Score of board b for the player to move.
+Positive if the player to move wins, negative if it loses, 0 for a cat's game.'''
+    if b.who_won() != None:
+      # The previous player won; with dtm, the earlier the win the larger the score
+      return -(1 + len(b.get_empty_idxs())) if self.params['dtm'] else -1
+    if b.is_full(): return 0
+    key = (b, b.e, b.p1, b.p2, b.it % 2, self.params['dtm'])
+    first = None
+    alpha_ori = alpha
+    try:
+      flag, score, first = NegamaxPlayer.table[key]
+      if flag == NegamaxPlayer.EXACT: return score
+      elif flag == NegamaxPlayer.LOWER: alpha = max(alpha, score)
+      else: beta = min(beta, score)
+      if alpha >= beta: return score
+    except KeyError:
+      pass
+    best_score = -float("inf")
+    best_move = None
+    for move in self.ordered_moves(b, first):
+      score = -self.negamax(b.play(move), -beta, -alpha)
+      if score > best_score:
+        best_score = score
+        best_move = move
+      alpha = max(alpha, score)
+      if alpha >= beta: break # The opponent will not let the game reach this board
+    if best_score <= alpha_ori: flag = NegamaxPlayer.UPPER
+    elif best_score >= beta: flag = NegamaxPlayer.LOWER
+    else: flag = NegamaxPlayer.EXACT
+    NegamaxPlayer.table[key] = (flag, best_score, best_move)
+    return best_score
+
+class MCTSNode():
+  '''Node of MCTSPlayer's search tree: a board and the results of the rollouts that went through it.'''
+
+  __slots__ = ('b', 'p', 'parent', 'children', 'untried', 'visits', 'wins')
+
+  def __init__(self, b, parent=None):
+    self.b = b
+    self.p = parent.b.next_player() if parent != None else None # Player who moved to b
+    self.parent = parent
+    self.children = {} # Move -> node
+    self.untried = [] if b.is_over() else b.get_empty_idxs()
+    random.shuffle(self.untried)
+    self.visits = 0
+    self.wins = 0.0 # Rollouts won by p, a cat's game counting as half a win
+
+def mcts_search(root, iterations, seconds, c):
+  '''Grow the tree under root by iterations rollouts or, if seconds > 0, by as many rollouts as fit in seconds.
+Return the number of rollouts.'''
+  deadline = time.perf_counter() + seconds
+  n = 0
+  while True:
+    node = root
+    # Selection, with UCT
+    while not node.untried and node.children:
+      log_n = math.log(node.visits)
+      node = max(node.children.values(), key=lambda ch: ch.wins / ch.visits + c * math.sqrt(log_n / ch.visits))
+    # Expansion
+    if node.untried:
+      move = node.untried.pop()
+      node.children[move] = MCTSNode(node.b.play(move), node)
+      node = node.children[move]
+    # Rollout
+    b = node.b
+    while not b.is_over():
+      b = b.play(random.choice(b.get_empty_idxs()))
+    w = b.who_won()
+    # Backpropagation
+    while node != None:
+      node.visits += 1
+      if w == None: node.wins += 0.5
+      elif w == node.p: node.wins += 1
+      node = node.parent
+    n += 1
+    if seconds > 0:
+      if time.perf_counter() >= deadline: return n
+    elif n >= iterations: return n
+
+def mcts_worker(job):
+  '''Search a new tree for board b; return {move : visits} for the moves from b.
+job is a tuple (b, iterations, seconds, c, seed), see mcts_search().'''
+  b, iterations, seconds, c, seed = job
+  random.seed(seed)
+  root = MCTSNode(b)
+  mcts_search(root, iterations, seconds, c)
+  return {move : ch.visits for move,ch in root.children.items()}
+
+class MCTSPlayer(ttt.AbsPlayer):
+  '''Monte Carlo tree search with UCT selection and random rollouts; plays the move explored the most.
+The search runs for a number of rollouts, or for a time per move, and the tree is kept from one move to the next.
+With more than one worker, each worker process searches its own tree from the board and the visits are added up.'''
+
+  name = "Monte Carlo tree search player"
+
+  params = {'iterations':
+              {'valfun' : lambda v: int(v) if int(v) > 0 else int('raise value error'),
+               'def' : 1000,
+               'msg' : 'Choose the number of rollouts per move, default %d: ',
+               'errmsg' : 'Invalid number.  Must be greater than 0.  Try again.'},
+            'time':
+              {'valfun' : lambda v: float(v) if float(v) >= 0 else int('raise value error'),
+               'def' : 0.0,
+               'msg' : 'Choose a time per move in seconds, 0 to use the number of rollouts instead, default %.2f: ',
+               'errmsg' : 'Invalid time.  Must be greater or equal to 0.  Try again.'},
+            'c':
+              {'valfun' : lambda v: float(v) if float(v) >= 0 else int('raise value error'),
+               'def' : 1.4,
+               'msg' : 'Choose the exploration constant, default %.2f: ',
+               'errmsg' : 'Invalid constant.  Must be greater or equal to 0.  Try again.'},
+            'workers':
+              {'valfun' : lambda v: int(v) if int(v) > 0 else int('raise value error'),
+               'def' : 1,
+               'msg' : 'Choose the number of processes running rollouts, default %d: ',
+               'errmsg' : 'Invalid number.  Must be greater than 0.  Try again.'},
+            }
+
+  # Number of worker processes -> pool, shared by all instances, until close()
+  executors = {}
+
+  @classmethod
+  def close(cls):
+    '''Shut down the worker processes; players with workers start new ones on their next move.'''
+    executors = list(cls.executors.values())
+    cls.executors.clear()
+    for executor in executors:
+      executor.shutdown()
+
+  def __init__(self, p, params={}):
+    self.p = p
+    self.params = {}
+    for param in MCTSPlayer.params:
+      self.params[param] = MCTSPlayer.params[param]['def'] # Set params to default
+    for param in params:
+      self.params[param] = params[param]
+    self.root = None
+    self.rollouts = 0 # Rollouts made for the last move, by this process and the workers
+
+  def start(self):
+    self.root = None
+
+  def find_root(self, b):
+    '''The node of b in the tree kept from the previous move, a new node if there is none.'''
+    if self.root != None:
+      for node in [self.root] + list(self.root.children.values()):
+        if node.b == b and node.b.it == b.it:
+          if ttt.stats != None: ttt.stats.cache('MCTSPlayer.tree', True)
+          node.parent = None
+          return node
+    if ttt.stats != None: ttt.stats.cache('MCTSPlayer.tree', False)
+    return MCTSNode(b)
+
+  def play(self, b):
+    root = self.find_root(b)
+    iterations = self.params['iterations']
+    seconds = self.params['time']
+    futures = []
+    workers = self.params['workers']
+    if workers > 1:
+      try: executor = MCTSPlayer.executors[workers - 1]
+      except KeyError:
+        executor = MCTSPlayer.executors[workers - 1] = concurrent.futures.ProcessPoolExecutor(workers - 1)
+      share = iterations // workers
+      futures = [executor.submit(mcts_worker, (b, share, seconds, self.params['c'], random.getrandbits(64)))
+                 for idx in range(0, workers - 1)]
+      iterations -= share * (workers - 1)
+    self.rollouts = mcts_search(root, iterations, seconds, self.params['c'])
+    visits = {move : ch.visits for move,ch in root.children.items()}
+    for f in futures:
+      counts = f.result()
+      for move in counts:
+        visits[move] = visits.get(move, 0) + counts[move]
+        self.rollouts += counts[move]
+    move = max(visits, key=visits.get)
+    self.root = root.children.get(move)
+    return move
+
+atexit.register(MCTSPlayer.close)
+
+class TablePlayer(ttt.AbsPlayer):
+  '''Plays the moves of a deterministic player, looked up in a table made by compile_player().
+The table holds the move 3*i+j of the player for every board code (see Board.encode()), NO_MOVE for boards
+not compiled; on those, the original player is asked.'''
+
+  NO_MOVE = 255
+  _MOVES = tuple((k // 3, k % 3) for k in range(0, 9))
+
+  # (player class, mark, params, root board, marks) -> table, shared by all instances
+  tables = {}
+
+  def __init__(self, player, table, marks=(' ', ttt.Board.default_p1, ttt.Board.default_p2)):
+    '''Player making the moves of player found in table, on boards with marks (empty, p1, p2).'''
+    self.p = player.p
+    self.player = player
+    self.table = table
+    self.marks = marks
+    self.name = 'Table of %s' % player.name
+
+  def start(self):
+    pass
+
+  def play(self, b):
+    if (b.m, b.n, b.k) == (3, 3, 3) and (b.e, b.p1, b.p2) == self.marks:
+      k = self.table[b.encode()]
+      if k != TablePlayer.NO_MOVE: return TablePlayer._MOVES[k]
+    return self.player.play(b)
+
+def compile_player(player, root=None, verify=True):
+  '''Return a TablePlayer making the moves of player on every board reachable from root (an empty Board by default).
+Tables are kept by class, mark and params of the player, so players with the same params are compiled once.
+If verify is true, player is asked again for every move, whether the table is built or found, and a table found
+that differs is built again, from player; ValueError is raised if a move differs from the table built.'''
+  if root == None: root = ttt.Board()
+  if (root.m, root.n, root.k) != (3, 3, 3): raise ValueError("Only players on 3x3 boards can be compiled.")
+  params = tuple(sorted(getattr(player, 'params', {}).items()))
+  key = (type(player).__name__, player.p, params, hash(root), root.e, root.p1, root.p2)
+  marks = (root.e, root.p1, root.p2)
+  table = TablePlayer.tables.get(key)
+  bs = None
+  if table == None or verify: bs = [b for b in root.get_descendants() if b.next_player() == player.p]
+  if table != None and verify and _differs(TablePlayer(player, table, marks), bs) != None:
+    table = None # Made by a player with the same class, mark and params, which plays differently
+  if table == None:
+    table = bytearray([TablePlayer.NO_MOVE]) * 3**9
+    player.start()
+    for b in bs:
+      i,j = player.play(b)
+      table[b.encode()] = 3*i + j
+    TablePlayer.tables[key] = table
+    if verify:
+      b = _differs(TablePlayer(player, table, marks), bs)
+      if b != None:
+        del TablePlayer.tables[key]
+        raise ValueError("%s is not deterministic, it plays differently on\n%s" % (player.name, b))
+  return TablePlayer(player, table, marks)
+
+def _differs(compiled, bs):
+  '''First of boards bs where compiled, a TablePlayer, plays differently from its player; None if there is none.'''
+  for b in bs:
+    if tuple(compiled.player.play(b)) != compiled.play(b): return b
+  return None
 
 # TODO:
 # Idea for a new player: learn the win, tie, los parameters
@@ -220,52 +705,120 @@ class RLPlayer(ttt.AbsPlayer):
 
   name = "Reinforcement learning player"
 
-  # TODO: Think about having an adjustable learn rate, one that decreases with time
+  # The learn rate is fixed while playing; ttt_train decreases it over the course of training
   params = {'lr': 
               {'valfun' : lambda v: float(v) if float(v) >= 0 and float(v) < 1 else int('raise value error'),
                'def' : 0.05,
                'msg' : 'Choose a learn rate in [0,1), default %.2f: ',
                'errmsg' : 'Invalid rate.  Must be greater or equal to 0 and less than 1.  Try again.'},
+            'eps':
+              {'valfun' : lambda v: float(v) if float(v) >= 0 and float(v) <= 1 else int('raise value error'),
+               'def' : 0.0,
+               'msg' : 'Choose how often to play a random move to explore, in [0,1], default %.2f: ',
+               'errmsg' : 'Invalid rate.  Must be between 0 and 1.  Try again.'},
             }
 
-  def __init__(self, p, params={}):
+  def __init__(self, p, params={}, seed=0):
+    '''Player p; seed seeds the player's own random numbers, which break ties and choose exploratory moves.'''
     self.p = p
     self.params = {}
-    for param in DRPlayer.params:
-      self.params[param] = DRPlayer.params[param]['def'] # Set params to default
+    for param in RLPlayer.params:
+      self.params[param] = RLPlayer.params[param]['def'] # Set params to default
     # If parameters have been passed to constructure, then override the parameter here
     for param in params:
       self.params[param] = params[param]
-    self.rewards = {}
-    self.prev_b = None
+    self.rng = random.Random(seed) # Not the random module: playing leaves the random numbers of others alone
+    self.rewards = {} # Canonical board -> learned value
+    self.table = None # Values loaded from a file, see load(); learned values are kept in rewards
+    self.prev_bs = {} # (game key, mark) -> board to learn from on our next move in that game, see play_batch()
+    self.kids = {} # (board, marks, parity of the iteration) -> children() of a 3x3 board
 
   def start(self):
-    self.prev_b = None
+    self.prev_bs = {}
+
+  def save(self, path):
+    '''Write the learned values, along with those loaded by load(), to path, see ttt_values.'''
+    values = dict(self.table.items()) if self.table != None else {}
+    marks = self.table.marks if self.table != None else (' ', ttt.Board.default_p1, ttt.Board.default_p2)
+    for cc in self.rewards:
+      if (cc.m, cc.n, cc.k) != (3, 3, 3): raise ValueError("Only values of 3x3 boards can be saved.")
+      marks = (cc.e, cc.p1, cc.p2)
+      values[cc.encode()] = self.rewards[cc]
+    meta = {'player' : type(self).__name__, 'p' : self.p, 'e' : marks[0], 'p1' : marks[1], 'p2' : marks[2],
+            'params' : self.params}
+    ttt_values.write(path, meta, values)
+
+  def load(self, path):
+    '''Start from the values saved to path by save(), and the parameters they were learned with.'''
+    table = ttt_values.load(path)
+    if table.meta['player'] != type(self).__name__ or table.meta['p'] != self.p:
+      raise ValueError("%s holds values of %s %s, not of %s %s." % (path, table.meta['player'], table.meta['p'],
+                       type(self).__name__, self.p))
+    self.params = dict(table.meta['params'])
+    self.table = table
+    self.rewards = {}
 
-  # TODO: Sometimes don't pick the best play but a random one (exploration)
-  # TODO: If there is more than one "best option", randomly pick among them
   def play(self, b):
-    best_b = None
-    best_reward = -float("inf")
+    return self.play_batch([b])[0]
+
+  def play_batch(self, bs, keys=None):
+    # Values learned on a move are used by the next ones, so the boards are played in order.  The board to learn
+    # from is kept by game and mark: the player may play both seats of a game.  Without keys, all boards are
+    # of the same game, as with play().
+    res = []
+    for idx,b in enumerate(bs):
+      key = (None if keys == None else keys[idx], b.next_player())
+      move, self.prev_bs[key] = self.move(b, self.prev_bs.get(key), *self.children(b))
+      res.append(move)
+    return res
+
+  def children(self, b):
+    '''Children of b, and their canonical forms: learned values are shared by rotations and reflections of a board.
+Those of 3x3 boards are kept: games reach the same boards over and over.'''
+    if (b.m, b.n, b.k) != (3, 3, 3):
+      cs = b.get_children()
+      return cs, [c.canonical()[0] for c in cs]
+    key = (b, b.e, b.p1, b.p2, b.it % 2) # The parity of it tells the player to move
+    try: return self.kids[key]
+    except KeyError: pass
     cs = b.get_children()
-    for c in cs:
-      if c not in self.rewards:
+    self.kids[key] = (cs, [c.canonical()[0] for c in cs])
+    return self.kids[key]
+
+  def move(self, b, prev_b, cs, ccs):
+    '''Move on b, given the board after our previous move in the game, prev_b, and the children of b.
+Learn from the move; return the move and the board to learn from on our next move.'''
+    best = []
+    best_reward = -float("inf")
+    for c,cc in zip(cs, ccs):
+      if cc not in self.rewards and self.table != None:
+        v = self.table.get(cc)
+        if v != None: self.rewards[cc] = v
+      if ttt.stats != None: ttt.stats.cache('RLPlayer.rewards', cc in self.rewards)
+      if cc not in self.rewards:
         if c.who_won() == self.p:
-          self.rewards[c] = 1.0
+          self.rewards[cc] = 1.0
         elif c.who_won() != None: # We lost
-          self.rewards[c] = 0.0
+          self.rewards[cc] = 0.0
         else:
-          self.rewards[c] = 0.5 # coin-toss
-      tmp = self.rewards[c]
+          self.rewards[cc] = 0.5 # coin-toss
+      tmp = self.rewards[cc]
       if best_reward < tmp:
         best_reward = tmp
-        best_b = c
-    assert(best_b != None)
-    if self.prev_b != None:
-      self.rewards[self.prev_b] += self.params['lr'] * (self.rewards[best_b] 
-                                    - self.rewards[self.prev_b])
-    self.prev_b = best_b
-    return get_play_from_parent_and_child(b,best_b)
+        best = [c]
+      elif best_reward == tmp:
+        best.append(c)
+    assert(best != [])
+    if self.params['eps'] > 0 and self.rng.random() < self.params['eps']:
+      # Exploratory move: play at random, and do not learn from it
+      best_b = self.rng.choice(cs)
+      return get_play_from_parent_and_child(b,best_b), ccs[cs.index(best_b)]
+    best_b = best[0] if len(best) == 1 else self.rng.choice(best) # Break ties at random
+    best_cb = ccs[cs.index(best_b)]
+    if prev_b != None:
+      self.rewards[prev_b] += self.params['lr'] * (self.rewards[best_cb] 
+                                    - self.rewards[prev_b])
+    return get_play_from_parent_and_child(b,best_b), best_cb
 
 
 
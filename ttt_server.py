@@ -0,0 +1,330 @@
+'''Tic-tac-toe server: remote clients play against the engines of ttt_player over TCP.
+
+Each connection hosts one game at a time.  Requests and replies are lines of
+words separated by spaces:
+
+  ENGINES                         ENGINES <name> ...
+  NEW <engine> [<mark>] [<param>=<value> ...]
+                                  OK <mark>, then the engine's move if it plays first
+  MOVE <row> <col>                MOVE <row> <col>, the engine's reply, unless the game ended
+                                  END <winner>, when the game ends ('-' for a cat's game)
+  BOARD                           BOARD <cells row by row, '.' for an empty cell>
+  QUIT                            the server closes the connection
+
+The client plays mark (p1 by default) against engine, with params given as in
+ttt.main.  Invalid requests get ERR <message>, and leave the game as it was.
+
+Engines are shared by all sessions: they run in a pool of worker processes,
+where each keeps its engines, and their caches, from one move to the next, so
+engine moves never block the event loop.  The state an engine keeps during a
+game travels with the session instead: for RLPlayer, the board it learns from
+on its next move.  RLPlayer starts from the values saved to the files given
+with --values (see RLPlayer.save()), memory-mapped and shared by the workers,
+and learns from every game played in its worker.  MCTSPlayer reuses its tree
+when its worker plays the next move of the same game.
+
+  python ttt_server.py serve [--port 8765] [--workers N] [--values <file> ...]
+  python ttt_server.py load [--port 8765] [--clients 50] [--games 20] [--engine DPlayer]
+
+load plays games against a running server, choosing its moves at random, and
+reports games per second and the latency of the engine's replies.
+'''
+
+__author__ ="Daniel S. Fava"
+__license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
+__year__   ="2018"
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+import threading
+import multiprocessing
+import concurrent.futures
+
+import ttt
+import ttt_player
+import ttt_values
+
+ENGINES = {cls.__name__ : cls for cls in (ttt_player.APlayer, ttt_player.DPlayer, ttt_player.ADPlayer,
+                                          ttt_player.DRPlayer, ttt_player.RLPlayer, ttt_player.NegamaxPlayer,
+                                          ttt_player.MCTSPlayer)}
+
+class EngineError(RuntimeError):
+  '''An engine failed to move, or its worker process died.'''
+
+# Shared engines of this thread, i.e. of this worker process, or of this thread with workers=0,
+# where engines that keep state must not play two moves at once: (name, mark, params) -> engine
+_local = threading.local()
+_values = {} # Mark -> file of the values RLPlayer starts from, see init_worker()
+
+def init_worker(values):
+  '''Set up a worker process; values is a dict mark -> file of values saved by RLPlayer.save().'''
+  _values.clear()
+  _values.update(values)
+
+def make_engine(name, p, params):
+  '''New engine name playing p, with params a tuple of (param, value) pairs.'''
+  cls = ENGINES[name]
+  if not hasattr(cls, 'params'):
+    if params: raise ValueError("%s does not take parameters." % name)
+    return cls(p)
+  engine = cls(p, params=dict(params))
+  if cls == ttt_player.RLPlayer and p in _values:
+    engine.load(_values[p]) # Memory-mapped, so the workers share the pages of the file
+    engine.params.update(params)
+  return engine
+
+def engine_move(name, p, params, b, prev=None):
+  '''Move on board b of the shared engine name playing p, created on first use in this process.
+prev is the state the engine keeps during the game, None on its first move: for RLPlayer, the board it learns from
+(see RLPlayer.move()).  Return the move and the state for the engine's next move.'''
+  try: engines = _local.engines
+  except AttributeError: engines = _local.engines = {}
+  key = (name, p, params)
+  try: engine = engines[key]
+  except KeyError: engine = engines[key] = make_engine(name, p, params)
+  if name == 'RLPlayer':
+    # The engine's previous move in the game may have been played in another worker: learn from it only if known here
+    if prev not in engine.rewards: prev = None
+    return engine.move(b, prev, *engine.children(b))
+  return engine.play(b), None
+
+def parse_params(cls, words):
+  '''Validate the words param=value of a NEW request, as ttt.main does; return a sorted tuple of (param, value).'''
+  params = {}
+  for word in words:
+    param, sep, value = word.partition('=')
+    if sep == '' or param not in getattr(cls, 'params', {}):
+      raise ValueError("Unknown parameter %s." % word)
+    try:
+      params[param] = cls.params[param]['valfun'](value)
+    except ValueError:
+      raise ValueError(cls.params[param]['errmsg'])
+  return tuple(sorted(params.items()))
+
+class Session():
+  '''A game between a client and an engine.'''
+
+  def __init__(self, name, mark, params):
+    self.b = ttt.Board()
+    self.name = name
+    self.mark = mark # The client's
+    self.p = self.b.p2 if mark == self.b.p1 else self.b.p1 # The engine's
+    self.params = params
+    self.prev = None # State of the engine during the game, see engine_move()
+
+class Server():
+
+  def __init__(self, workers=None, values={}):
+    '''Server running the engines on workers processes (one per CPU if None, in threads of this process if 0).
+values is a dict mark -> file of the values RLPlayer starts from, saved by RLPlayer.save().'''
+    self.workers = workers
+    self.values = dict(values)
+    self.executor = self.make_executor()
+    self.sessions = 0
+    self.games = 0
+    self.moves = 0
+
+  def make_executor(self):
+    if self.workers == 0:
+      return concurrent.futures.ThreadPoolExecutor(initializer=init_worker, initargs=(self.values,))
+    # Spawned, not forked: a forked worker would hold the sockets of the clients connected at the time
+    return concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=init_worker, initargs=(self.values,))
+
+  async def start(self, host='127.0.0.1', port=8765):
+    '''Start listening; return the asyncio server.'''
+    return await asyncio.start_server(self.handle, host, port)
+
+  def close(self):
+    self.executor.shutdown()
+
+  async def engine_play(self, session):
+    '''Let the engine of session play; return its reply lines.  Raise EngineError if it fails.'''
+    loop = asyncio.get_running_loop()
+    executor = self.executor
+    try:
+      move, prev = await loop.run_in_executor(executor, engine_move, session.name, session.p, session.params,
+                                              session.b, session.prev)
+    except concurrent.futures.BrokenExecutor:
+      # A worker died, and the pool with it: the next moves go to a new pool
+      if self.executor is executor:
+        self.executor = self.make_executor()
+        executor.shutdown(wait=False)
+      raise EngineError("The engine stopped; try again.")
+    except (ValueError, RuntimeWarning):
+      raise # Invalid params, answered as invalid requests
+    except Exception as e:
+      raise EngineError("The engine failed: %s." % e)
+    session.b = session.b.play(move)
+    session.prev = prev
+    self.moves += 1
+    return ['MOVE %d %d' % tuple(move)] + self.end(session)
+
+  def end(self, session):
+    if not session.b.is_over(): return []
+    self.games += 1
+    w = session.b.who_won()
+    return ['END %s' % ('-' if w == None else w)]
+
+  async def request(self, session, words):
+    '''Serve the request words; return the new session and the reply lines.'''
+    cmd = words[0].upper()
+    if cmd == 'ENGINES':
+      return session, ['ENGINES ' + ' '.join(ENGINES)]
+    if cmd == 'NEW':
+      if len(words) < 2 or words[1] not in ENGINES:
+        raise ValueError("Usage: NEW <engine> [<mark>] [<param>=<value> ...], engine one of %s." % ' '.join(ENGINES))
+      mark = ttt.Board.default_p1
+      rest = words[2:]
+      if rest and '=' not in rest[0]:
+        mark = rest.pop(0)
+        if mark not in (ttt.Board.default_p1, ttt.Board.default_p2):
+          raise ValueError("Mark must be %s or %s." % (ttt.Board.default_p1, ttt.Board.default_p2))
+      session = Session(words[1], mark, parse_params(ENGINES[words[1]], rest))
+      lines = ['OK %s' % mark]
+      if session.b.next_player() == session.p: lines += await self.engine_play(session)
+      self.sessions += 1
+      return session, lines
+    if cmd == 'MOVE':
+      if session == None or session.b.is_over(): raise ValueError("No game in progress.")
+      try: i, j = int(words[1]), int(words[2])
+      except (IndexError, ValueError): raise ValueError("Usage: MOVE <row> <col>.")
+      if not (0 <= i < 3 and 0 <= j < 3): raise ValueError("Invalid play. Value must be in [0,1,2].")
+      b = session.b
+      session.b = session.b.play(i, j)
+      lines = self.end(session)
+      if lines == []:
+        try:
+          lines = await self.engine_play(session)
+        except EngineError:
+          session.b = b # The client plays its move again
+          raise
+      return session, lines
+    if cmd == 'BOARD':
+      if session == None: raise ValueError("No game.")
+      return session, ['BOARD ' + ''.join('.' if el == session.b.e else el for r in session.b.b for el in r)]
+    raise ValueError("Unknown request %s." % cmd)
+
+  async def handle(self, reader, writer):
+    session = None
+    try:
+      while True:
+        try:
+          line = await reader.readline()
+        except ValueError: # The line is longer than the reader's limit
+          writer.write(b'ERR Request too long.\n')
+          await writer.drain()
+          break
+        if not line: break
+        words = line.decode(errors='replace').split()
+        if not words: continue
+        if words[0].upper() == 'QUIT': break
+        try:
+          session, lines = await self.request(session, words)
+        except (ValueError, RuntimeWarning, EngineError) as e:
+          lines = ['ERR %s' % ' '.join(str(e).split())] # On one line
+        writer.write(''.join(l + '\n' for l in lines).encode())
+        await writer.drain()
+    except ConnectionError:
+      pass
+    finally:
+      writer.close()
+
+async def play_client(host, port, engine, games, latencies, params=(), seed=None):
+  '''Play games games against engine, choosing moves at random, alternating marks.
+Append to latencies the time, in seconds, from each move to the server's reply.'''
+  rnd = random.Random(seed)
+  reader, writer = await asyncio.open_connection(host, port)
+
+  async def read():
+    words = (await reader.readline()).decode().split()
+    if not words or words[0] == 'ERR': raise RuntimeError('Server replied %s' % ' '.join(words))
+    return words
+
+  try:
+    for idx in range(0, games):
+      mark = ttt.Board.default_p1 if idx % 2 == 0 else ttt.Board.default_p2
+      writer.write(('NEW %s %s %s\n' % (engine, mark, ' '.join(params))).encode())
+      b = ttt.Board()
+      await read() # OK
+      if b.next_player() != mark:
+        words = await read()
+        b = b.play(int(words[1]), int(words[2]))
+      while not b.is_over():
+        move = rnd.choice(b.get_empty_idxs())
+        b = b.play(move)
+        start = time.perf_counter()
+        writer.write(('MOVE %d %d\n' % move).encode())
+        words = await read()
+        latencies.append(time.perf_counter() - start)
+        if words[0] == 'MOVE':
+          b = b.play(int(words[1]), int(words[2]))
+          if b.is_over(): words = await read()
+      assert(words[0] == 'END')
+    writer.write(b'QUIT\n')
+    await writer.drain()
+  finally:
+    writer.close()
+
+def percentile(xs, q):
+  xs = sorted(xs)
+  return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+async def run_load(host, port, engine, clients, games, params=(), seed=0):
+  '''Play games games on each of clients concurrent connections.
+Return (games per second, median move latency, p99 move latency), latencies in seconds.'''
+  latencies = []
+  start = time.perf_counter()
+  await asyncio.gather(*(play_client(host, port, engine, games, latencies, params, '%s-%d' % (seed, idx))
+                         for idx in range(0, clients)))
+  t = time.perf_counter() - start
+  return clients * games / t, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+async def serve(host, port, workers, values):
+  server = Server(workers, values)
+  listener = await server.start(host, port)
+  print('Serving on %s' % ', '.join('%s:%d' % s.getsockname()[:2] for s in listener.sockets))
+  try:
+    async with listener:
+      await listener.serve_forever()
+  finally:
+    server.close()
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Play tic-tac-toe engines over TCP.')
+  parser.add_argument('command', choices=('serve', 'load'))
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--workers', type=int, default=None,
+                      help='serve: processes running the engines, one per CPU by default, 0 for threads')
+  parser.add_argument('--values', action='append', default=[],
+                      help="serve: file of RLPlayer's values to start from, see RLPlayer.save() (one per mark)")
+  parser.add_argument('--clients', type=int, default=50, help='load: concurrent connections')
+  parser.add_argument('--games', type=int, default=20, help='load: games per connection')
+  parser.add_argument('--engine', default='DPlayer', help='load: engine to play against, one of %s' % ', '.join(ENGINES))
+  parser.add_argument('--param', action='append', default=[], help='load: engine parameter, param=value')
+  args = parser.parse_args(argv[1:])
+
+  if args.command == 'serve':
+    values = {}
+    for path in args.values:
+      table = ttt_values.load(path)
+      if table.meta['player'] != 'RLPlayer':
+        print('%s holds values of %s, not of RLPlayer' % (path, table.meta['player']))
+        return 1
+      values[table.meta['p']] = path
+    try:
+      asyncio.run(serve(args.host, args.port, args.workers, values))
+    except KeyboardInterrupt:
+      pass
+    return 0
+  rate, p50, p99 = asyncio.run(run_load(args.host, args.port, args.engine, args.clients, args.games, args.param))
+  print('%d games against %s: %.1f games/s, move latency p50 %.2f ms, p99 %.2f ms' % (
+        args.clients * args.games, args.engine, rate, p50 * 1e3, p99 * 1e3))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
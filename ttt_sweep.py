@@ -0,0 +1,141 @@
+'''Sweeps of DRPlayer's parameters: rewards and moves for many settings of (dr, win, tie, los) at once.
+
+All settings follow the same recursion over the same boards, so a sweep walks the
+canonical boards once, keeping for each board a vector of rewards, one per setting.
+The children of a board are added one at a time, in the order DRPlayer adds them,
+so every reward, and therefore every move, is the one DRPlayer computes for that
+setting, to the last bit.
+
+  python ttt_sweep.py [x|o]
+
+prints the settings of a grid that play alike.
+'''
+
+__author__ ="Daniel S. Fava"
+__license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
+__year__   ="2018"
+
+import sys
+import time
+import itertools
+
+import numpy as np
+
+import ttt
+import ttt_player
+
+PARAMS = ('dr', 'win', 'tie', 'los')
+
+def grid(**values):
+  '''Settings of every combination of values, e.g. grid(dr=(0.9, 0.96), los=(-1, -2)); other params keep their defaults.'''
+  names = sorted(values)
+  return [dict(zip(names, combo)) for combo in itertools.product(*(values[name] for name in names))]
+
+class StateGraph():
+  '''The canonical boards reachable from a board, and their children, as DRPlayer.compute_reward() walks them.'''
+
+  def __init__(self, root=None):
+    if root == None: root = ttt.Board()
+    self.boards = root.get_descendants(canonical=True)
+    self.ids = {b : n for n,b in enumerate(self.boards)}
+    self.winner = [b.who_won() for b in self.boards]
+    self.over = np.array([b.is_over() for b in self.boards])
+    # Children of each board not over, canonical, with repeats, in the order of iter_children(), and their moves
+    self.children = {}
+    self.moves = {}
+    for s,b in enumerate(self.boards):
+      if self.over[s]: continue
+      self.children[s] = [self.ids[c.canonical()[0]] for c in b.iter_children()]
+      self.moves[s] = b.get_empty_idxs()
+    # Boards not over, grouped by number of moves, most moves first so that children come before their parents.
+    # Boards after the same number of moves have the same number of children: levels are (boards, children) arrays.
+    self.levels = []
+    for it in sorted({b.it for b in self.boards}, reverse=True):
+      ss = [s for s in self.children if self.boards[s].it == it]
+      if ss: self.levels.append((np.array(ss), np.array([self.children[s] for s in ss])))
+
+  def __len__(self):
+    return len(self.boards)
+
+class Sweep():
+
+  def __init__(self, p, settings, graph=None):
+    '''Rewards and moves of DRPlayer(p, params=setting) for each of settings, dicts of params (see grid()).
+graph is a StateGraph, of the empty board by default; build it once to sweep several times.'''
+    self.p = p
+    self.graph = graph if graph != None else StateGraph()
+    self.settings = [dict({param : ttt_player.DRPlayer.params[param]['def'] for param in PARAMS}, **s) for s in settings]
+    dr, win, tie, los = (np.array([s[param] for s in self.settings], dtype=np.float64) for param in PARAMS)
+    g = self.graph
+    # rewards[board, setting], as DRPlayer.compute_reward()
+    self.rewards = np.empty((len(g), len(self.settings)))
+    for s,w in enumerate(g.winner):
+      if g.over[s]: self.rewards[s] = tie if w == None else win if w == p else los
+    for ss, kids in g.levels:
+      reward = np.zeros((len(ss), len(self.settings)))
+      for k in range(0, kids.shape[1]):
+        reward += self.rewards[kids[:, k]]
+      self.rewards[ss] = dr * (reward / kids.shape[1])
+    # Where p plays: the index of the best child (the first of the best, as DRPlayer.play()) for each setting,
+    # and which children tie for best, which decides the move on the other orientations of the board
+    self.best = {}
+    self.top = {}
+    for ss, kids in g.levels:
+      mine = [r for r,s in enumerate(ss) if g.boards[s].next_player() == p]
+      if not mine: continue
+      rewards = self.rewards[kids[mine]]
+      top = rewards == rewards.max(axis=1, keepdims=True)
+      best = top.argmax(axis=1)
+      for r,b,t in zip(mine, best, top):
+        self.best[int(ss[r])] = b
+        self.top[int(ss[r])] = t
+
+  def __len__(self):
+    return len(self.settings)
+
+  def policy(self, i):
+    '''Moves of setting i on the canonical boards, as a dict canonical board -> move.'''
+    g = self.graph
+    return {g.boards[s] : g.moves[s][b[i]] for s,b in self.best.items()}
+
+  def player(self, i):
+    '''A DRPlayer with the params of setting i, which looks its rewards up instead of computing them.'''
+    pl = ttt_player.DRPlayer(self.p, params=self.settings[i])
+    pl.table = SweepRewards(self, i)
+    return pl
+
+  def groups(self):
+    '''Lists of the settings that make the same moves, on every orientation of every board.'''
+    res = {}
+    for i in range(0, len(self)):
+      res.setdefault(b''.join(t[:, i].tobytes() for t in self.top.values()), []).append(i)
+    return list(res.values())
+
+class SweepRewards():
+  '''Rewards of one setting of a sweep, looked up by DRPlayer as the rewards of a table (see DRPlayer.load()).'''
+
+  def __init__(self, sweep, i):
+    self.sweep = sweep
+    self.i = i
+    root = sweep.graph.boards[0]
+    self.marks = (root.e, root.p1, root.p2)
+
+  def get(self, b):
+    '''Reward of canonical board b, None if the sweep does not reach it.'''
+    if (b.e, b.p1, b.p2) != self.marks: return None
+    s = self.sweep.graph.ids.get(b)
+    return None if s == None else float(self.sweep.rewards[s, self.i])
+
+def main(argv):
+  p = argv[1] if len(argv) > 1 else ttt.Board.default_p1
+  settings = grid(dr=np.linspace(0.05, 1, 20).round(2).tolist(), win=(1, 2), tie=(-0.5, 0, 0.5), los=(-1, -2))
+  t = time.perf_counter()
+  sweep = Sweep(p, settings)
+  t = time.perf_counter() - t
+  print('%d settings in %.3f s' % (len(sweep), t))
+  for group in sweep.groups():
+    print('%3d settings play alike, e.g. %s' % (len(group), sweep.settings[group[0]]))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
@@ -5,6 +5,26 @@ import unittest
 
 import ttt
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+_db_dir = None
+
+def setUpModule():
+  # The solved-state database, looked up by the players and by the tests, built in a temporary directory
+  import os
+  import tempfile
+  import ttt_player
+  global _db_dir
+  _db_dir = tempfile.TemporaryDirectory()
+  os.environ['TTT_DB'] = os.path.join(_db_dir.name, 'ttt.db')
+  ttt_player.solved_db(build=True)
+
+def tearDownModule():
+  _db_dir.cleanup()
+
 class TttTest(unittest.TestCase):
 
     def test_get_empty_idxs(self):
@@ -138,6 +158,18 @@ class TttTest(unittest.TestCase):
       #print(len(cats))
       self.assertEqual(len(cats), 16)
 
+    def test_status_carried(self):
+      # Boards made by play() know their status; boards built from a tuple work it out
+      for b in ttt.Board().get_descendants():
+        nb = ttt.Board(b.b, it=b.it)
+        self.assertEqual(b.who_won(), nb.who_won())
+        self.assertEqual(b.is_over(), nb.is_over())
+        self.assertEqual(b.is_full(), nb.is_full())
+        self.assertEqual(b.is_empty(), nb.is_empty())
+        self.assertEqual(b.next_player(), nb.next_player())
+        c,t = b.canonical()
+        self.assertEqual(c.is_over(), b.is_over())
+
     def test_le(self):
       b1 = ttt.Board()
       b2 = ttt.Board()
@@ -163,6 +195,1082 @@ class TttTest(unittest.TestCase):
       for o in options:
         ttt.get_input(o['valfun'], o['def'], o['msg'], o['errmsg'])
     
+class BitBoardTest(unittest.TestCase):
+
+    def test_descendants_match_board(self):
+      bs = ttt.Board().get_descendants()
+      bbs = ttt.BitBoard().get_descendants()
+      self.assertEqual(len(bbs), 5478)
+      self.assertEqual(set(bs), set(bbs))
+      bs = {b : b for b in bs}
+      for bb in bbs:
+        b = bs[bb]
+        self.assertEqual(hash(bb), hash(b))
+        self.assertEqual(bb.b, b.b)
+        self.assertEqual(bb.who_won(), b.who_won())
+        self.assertEqual(bb.is_over(), b.is_over())
+        self.assertEqual(bb.next_player(), b.next_player())
+        self.assertEqual(bb.get_empty_idxs(), b.get_empty_idxs())
+        self.assertEqual(bb.get_children(), b.get_children())
+
+    def test_from_tuple(self):
+      b = ttt.Board().play(1,1).play(0,2).play(2,2)
+      bb = ttt.BitBoard(b.b, it=b.it)
+      self.assertEqual(bb, b)
+      self.assertEqual(bb[1,1], 'x')
+      self.assertEqual(bb[0], (' ', ' ', 'o'))
+      self.assertTrue(ttt.BitBoard() <= bb)
+      self.assertTrue(bb <= b)
+      self.assertFalse(bb <= ttt.BitBoard())
+
+    def test_play(self):
+      b = ttt.BitBoard().play(0,0)
+      self.assertRaises(RuntimeWarning, b.play, 0, 0)
+      for idx in [(1,0), (0,1), (1,1), (0,2)]:
+        b = b.play(idx)
+      self.assertEqual(b.who_won(), 'x')
+      self.assertRaises(RuntimeWarning, b.play, 2, 2)
+
+    def test_game(self):
+      import ttt_player
+      g = ttt.Game(ttt_player.ADPlayer('x'), ttt_player.DPlayer('o'), b=ttt.BitBoard())
+      g.start()
+      self.assertTrue(g.b.is_over())
+      self.assertIsInstance(g.b, ttt.BitBoard)
+
+class MNKBoardTest(unittest.TestCase):
+
+    def test_descendants_match_board(self):
+      bs = ttt.Board().get_descendants()
+      mbs = ttt.MNKBoard().get_descendants()
+      self.assertEqual(set(bs), set(mbs))
+      bs = {b : b for b in bs}
+      for mb in mbs:
+        b = bs[mb]
+        self.assertEqual(mb.who_won(), b.who_won())
+        self.assertEqual(ttt.MNKBoard(mb.b, it=mb.it).who_won(), b.who_won())
+        self.assertEqual(mb.is_over(), b.is_over())
+        self.assertEqual(mb.get_empty_idxs(), b.get_empty_idxs())
+        self.assertEqual(mb.canonical(), b.canonical())
+      self.assertEqual(len(ttt.MNKBoard().get_descendants(canonical=True)), 765)
+
+    def test_who_won(self):
+      b = ttt.MNKBoard(m=4, n=5, k=4)
+      for idx in [(0,4), (0,0), (1,3), (1,1), (2,2), (3,3)]:
+        self.assertEqual(b.who_won(), None)
+        b = b.play(idx)
+      self.assertFalse(b.is_over())
+      b = b.play(3,1)
+      self.assertEqual(b.who_won(), 'x') # Anti-diagonal through the last move
+      self.assertEqual(ttt.MNKBoard(b.b, it=b.it, k=4).who_won(), 'x')
+      self.assertEqual(ttt.MNKBoard(b.b, it=b.it, k=5).who_won(), None)
+      self.assertRaises(RuntimeWarning, b.play, 2, 0)
+      self.assertNotEqual(ttt.MNKBoard(m=4, n=4, k=3), ttt.MNKBoard(m=4, n=4, k=4))
+      import ttt_db
+      self.assertFalse(ttt_db.compatible(ttt.MNKBoard(k=2)))
+
+    def test_symmetries(self):
+      for m,n in ((4,4), (3,5)):
+        b = ttt.MNKBoard(m=m, n=n).play(0,1).play(1,0).play(2,3)
+        c,t = b.canonical()
+        for tt in b.symmetries():
+          self.assertEqual(b.transform(tt).canonical()[0], c)
+          self.assertEqual(b.transform(tt).who_won(), None)
+        for idx in c.get_empty_idxs():
+          self.assertEqual(c.play(idx), b.play(ttt.transform_move(idx, ttt.INVERSE[t], m, n)).transform(t))
+
+    def test_games(self):
+      import ttt_player
+      for p1, p2, b in ((ttt_player.DPlayer, ttt_player.DPlayer, ttt.MNKBoard(m=7, n=7, k=5)),
+                        (ttt_player.ADPlayer, ttt_player.DRPlayer, ttt.MNKBoard(m=2, n=4, k=3)),
+                        (ttt_player.NegamaxPlayer, ttt_player.NegamaxPlayer, ttt.MNKBoard(m=3, n=4, k=3))):
+        g = ttt.Game(p1('x'), p2('o'), b=b)
+        g.start()
+        self.assertTrue(g.b.is_over())
+        self.assertEqual((g.b.m, g.b.n), (b.m, b.n))
+      self.assertEqual(g.b.who_won(), 'x') # 3,4,3 is a first player win
+
+class SolvedDBTest(unittest.TestCase):
+
+    def test_hist(self):
+      import ttt_player
+      bs = ttt.Board().get_descendants()
+      for b in bs[::97] + [ttt.Board()]:
+        hist = {None : 0, b.p1 : 0, b.p2 : 0}
+        for d in b.get_descendants():
+          hist[d.who_won()] += 1
+        self.assertEqual(ttt_player.solved_db().hist(b), hist)
+
+    def test_value(self):
+      import ttt_player
+      db = ttt_player.solved_db()
+      b = ttt.Board()
+      self.assertEqual(db.value(b), None)
+      # Perfect play from both sides ends in a cat's game
+      while not b.is_over():
+        b = b.play(db.best_move(b))
+      self.assertEqual(b.who_won(), None)
+      self.assertEqual(db.best_move(b), None)
+      b = ttt.Board().play(0,0).play(0,1).play(1,1).play(2,2)
+      self.assertEqual(db.value(b), 'x')
+      self.assertEqual(db.value(b.play(db.best_move(b))), 'x')
+      self.assertEqual(db.value(b.play(0,2)), None)
+
+    def test_lazy(self):
+      import os
+      import subprocess
+      import tempfile
+      # Importing the players neither builds nor writes the database; players do without it
+      with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ttt.db')
+        code = 'import ttt, ttt_player; ttt_player.APlayer("x").play(ttt.Board()); print(ttt_player.solved_db())'
+        out = subprocess.run([sys.executable, '-c', code], env=dict(os.environ, TTT_DB=path),
+                             cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        self.assertEqual(out.stdout.strip(), 'None')
+        self.assertFalse(os.path.exists(path))
+
+    def test_load(self):
+      import os
+      import tempfile
+      import ttt_db
+      with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ttt.db')
+        self.assertEqual(ttt_db.load(path), None) # Missing
+        self.assertFalse(os.path.exists(path))
+        db = ttt_db.load(path, rebuild=True) # Rebuilt
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(db.hist(ttt.Board()), {None : 4536, 'x' : 626, 'o' : 316})
+        with open(path, 'r+b') as f:
+          f.write(b'XXXX') # Corrupt the header
+        self.assertEqual(ttt_db.load(path), None)
+        db = ttt_db.load(path, rebuild=True)
+        self.assertEqual(db.hist(ttt.Board()), {None : 4536, 'x' : 626, 'o' : 316})
+        # Kept in memory if the file cannot be written, or is not to be
+        for path, save in ((os.path.join(d, 'missing', 'ttt.db'), True), (os.path.join(d, 'unsaved.db'), False)):
+          db = ttt_db.load(path, rebuild=True, save=save)
+          self.assertFalse(os.path.exists(path))
+          self.assertEqual(db.hist(ttt.Board()), {None : 4536, 'x' : 626, 'o' : 316})
+
+class SymmetryTest(unittest.TestCase):
+
+    def test_canonical(self):
+      b = ttt.Board().play(0,1).play(0,0).play(2,2)
+      c,t = b.canonical()
+      self.assertEqual(b.transform(t), c)
+      for tt in range(0, len(ttt.TRANSFORMS)):
+        self.assertEqual(b.transform(tt).canonical()[0], c)
+        self.assertEqual(ttt.BitBoard(b.transform(tt).b, it=3).canonical()[0], c)
+      # Moves on the canonical board map back to the same square on the original board
+      for idx in c.get_empty_idxs():
+        self.assertEqual(c.play(idx), b.play(ttt.transform_move(idx, ttt.INVERSE[t])).transform(t))
+
+    def test_get_descendants(self):
+      bs = ttt.Board().get_descendants(canonical=True)
+      self.assertEqual(len(bs), 765)
+      self.assertEqual(set(bs), set(b.canonical()[0] for b in ttt.Board().get_descendants()))
+      self.assertEqual(set(bs), set(ttt.BitBoard().get_descendants(canonical=True)))
+
+    def test_shared_values(self):
+      import ttt_player
+      p = ttt_player.DRPlayer('o')
+      b = ttt.Board().play(0,0)
+      self.assertEqual(p.play(b), (1,1))
+      # Rewards are computed for one orientation of the board, and looked up for the others
+      misses = p.cache.misses
+      for t in range(0, len(ttt.TRANSFORMS)):
+        self.assertEqual(p.play(b.transform(t)), (1,1))
+      self.assertEqual(p.cache.misses, misses)
+
+class BoardPoolTest(unittest.TestCase):
+
+    def tearDown(self):
+      ttt.Board.pool = None
+
+    def test_interned(self):
+      ttt.Board.pool = ttt.BoardPool()
+      b1 = ttt.Board().play(0,0).play(1,1)
+      b2 = ttt.Board().play(0,0).play(1,1)
+      self.assertIs(b1, b2)
+      self.assertIs(ttt.Board().get_children()[4], ttt.Board().play(1,1))
+      self.assertEqual(len(ttt.Board().get_descendants()), 5478)
+      self.assertEqual(len(ttt.Board.pool), 5477) # The empty board is not created through the pool
+
+    def test_bounded(self):
+      ttt.Board.pool = ttt.BoardPool(maxsize=100)
+      bs = ttt.Board().get_descendants()
+      self.assertEqual(len(bs), 5478)
+      self.assertLessEqual(len(ttt.Board.pool), 100)
+      ttt.Board.pool.clear()
+      self.assertEqual(len(ttt.Board.pool), 0)
+
+    def test_slots(self):
+      b = ttt.Board()
+      self.assertRaises(AttributeError, setattr, b, 'foo', 1)
+      self.assertEqual(hash(b), hash(ttt.Board()))
+      self.assertEqual(hash(b), hash(ttt.BitBoard()))
+
+class TraversalTest(unittest.TestCase):
+
+    def test_iter_children(self):
+      for b in (ttt.Board().play(0,0), ttt.BitBoard().play(0,0), ttt.MNKBoard(m=4, n=5, k=3).play(1,2)):
+        self.assertEqual(list(b.iter_children()), b.get_children())
+      b = ttt.Board((('x','x','x'),('o','o',' '),(' ',' ',' ')), it=5)
+      self.assertEqual(list(b.iter_children()), [])
+
+    def test_iter_descendants(self):
+      b = ttt.Board()
+      self.assertEqual(list(b.iter_descendants()), b.get_descendants())
+      self.assertEqual(list(b.iter_descendants(canonical=True)), b.get_descendants(canonical=True))
+      # Boards with up to 3 marks: 1 + 9 + 72 + 252, reached by 1 + 9 + 72 + 504 paths
+      self.assertEqual(sum(1 for _ in b.iter_descendants(prune=lambda b: b.it >= 3)), 334)
+      self.assertEqual(sum(1 for _ in b.iter_descendants(prune=lambda b: b.it >= 3, visited=False)), 586)
+
+    def test_early_exit(self):
+      stats = ttt.enable_stats()
+      try:
+        it = ttt.Board().iter_descendants()
+        for b in it:
+          if b.who_won() != None: break
+        # Depth first: the first win is found on the first path walked down, and counted as visited
+        # while the generator is still alive
+        self.assertEqual(stats.descendants_visited, b.it + 1)
+        del it
+        self.assertEqual(stats.descendants_visited, b.it + 1)
+      finally:
+        ttt.disable_stats()
+
+class EnumConfsTest(unittest.TestCase):
+
+    def test_serial(self):
+      codes = ttt.Board.enum_confs()
+      self.assertEqual(codes, {b.encode() for b in ttt.Board().get_descendants()})
+      self.assertEqual(ttt.BitBoard.enum_confs(), codes)
+      root = ttt.Board()
+      self.assertEqual({root.decode(c) for c in codes}, set(root.get_descendants()))
+
+    def test_workers(self):
+      lines = []
+      codes = ttt.MNKBoard.enum_confs(workers=2, report=lines.append, m=2, n=4, k=3)
+      root = ttt.MNKBoard(m=2, n=4, k=3)
+      self.assertEqual(codes, {b.encode() for b in root.get_descendants()})
+      self.assertEqual(root.decode(root.play(1,2).encode()), root.play(1,2))
+      self.assertTrue(lines[0].startswith('%d boards' % len(codes)))
+
+class ThreatIndexTest(unittest.TestCase):
+
+    def winning_squares(self, b, p):
+      res = []
+      for i,j in b.get_empty_idxs():
+        rows = [list(r) for r in b.b]
+        rows[i][j] = p
+        if ttt.Board(tuple(tuple(r) for r in rows)).who_won() == p: res.append((i,j))
+      return res
+
+    def defend_move(self, b, p):
+      # Move of DPlayer before the threat index, from the grandchildren of b
+      import ttt_player
+      for c in b.get_children():
+        for gc in c.get_children():
+          if gc.who_won() != None and gc.who_won() != p:
+            return ttt_player.get_play_from_parent_and_child(c, gc)
+      return None
+
+    def test_winning_squares(self):
+      for b in ttt.Board().get_descendants():
+        fresh = ttt.Board(b.b, it=b.it)
+        others = (fresh, ttt.BitBoard(b.b, it=b.it), ttt.MNKBoard(b.b, it=b.it))
+        for p in ('x', 'o'):
+          if b.who_won() == None: self.assertEqual(b.winning_squares(p), self.winning_squares(b, p))
+          for o in others:
+            self.assertEqual(o.winning_squares(p), b.winning_squares(p))
+            self.assertEqual(o.open_lines(p), b.open_lines(p))
+      self.assertEqual(ttt.Board().winning_squares('z'), [])
+
+    def test_open_lines(self):
+      b = ttt.Board()
+      self.assertEqual(b.open_lines('x'), 8)
+      b = b.play(1,1)
+      self.assertEqual((b.open_lines('x'), b.open_lines('o')), (8, 4))
+      b = b.play(0,0)
+      self.assertEqual((b.open_lines('x'), b.open_lines('o')), (5, 4))
+      b = ttt.MNKBoard(m=4, n=5, k=4).play(0,0)
+      self.assertEqual((b.open_lines('x'), b.open_lines('o')), (17, 14))
+
+    def test_defend_move(self):
+      import ttt_player
+      for b in ttt.Board().get_descendants():
+        for p in ('x', 'o'):
+          self.assertEqual(ttt_player.defend_move(b, p), self.defend_move(b, p))
+      for b in ttt.MNKBoard(m=3, n=4, k=3).get_descendants()[::20]:
+        for p in ('x', 'o'):
+          self.assertEqual(ttt_player.defend_move(b, p), self.defend_move(b, p))
+
+class OutcomeCountTest(unittest.TestCase):
+
+    def descendant_hist(self, b):
+      hist = {None : 0, b.p1 : 0, b.p2 : 0}
+      for d in b.get_descendants():
+        hist[d.who_won()] += 1
+      return hist
+
+    def test_outcome_counts(self):
+      self.assertEqual(ttt.Board().outcome_counts(), {None : 4536, 'x' : 626, 'o' : 316})
+      for b in ttt.Board().get_descendants()[::53]:
+        self.assertEqual(b.outcome_counts(), self.descendant_hist(b))
+      b = ttt.Board(p1='a', p2='b').play(1,1)
+      self.assertEqual(b.outcome_counts(), self.descendant_hist(b))
+
+    def test_moves_unchanged(self):
+      import ttt_player
+      def reference_move(player, b):
+        # APlayer's choice, computed from get_descendants() as before outcome counting
+        best_score = -float("inf")
+        for c in b.get_children():
+          hist = self.descendant_hist(c)
+          score = hist[player] / (hist[None] + hist[b.p1] + hist[b.p2])
+          if score > best_score:
+            best_score = score
+            best = ttt_player.get_play_from_parent_and_child(b, c)
+        return best
+      # Marks other than the default ones are not in the solved-state database
+      bs = [b for b in ttt.Board(p1='a', p2='b').get_descendants() if not b.is_over()]
+      for b in bs[1::37]:
+        p = b.next_player()
+        self.assertEqual(ttt_player.APlayer(p).play(b), reference_move(p, b))
+        # Same boards with the default marks are looked up in the database
+        db_b = ttt.Board(tuple(tuple({b.e : ' ', 'a' : 'x', 'b' : 'o'}[el] for el in r) for r in b.b), it=b.it)
+        self.assertEqual(ttt_player.APlayer(db_b.next_player()).play(db_b), reference_move(p, b))
+
+class RewardCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+      import ttt_player
+      c = ttt_player.RewardCache(maxsize=2)
+      c.put('a', 1)
+      c.put('b', 2)
+      self.assertEqual(c.get('a'), 1)
+      c.put('c', 3) # Evicts 'b', the least recently used
+      self.assertRaises(KeyError, c.get, 'b')
+      self.assertEqual(c.get('a'), 1)
+      self.assertEqual(c.get('c'), 3)
+      self.assertEqual((c.hits, c.misses), (3, 1))
+
+    def test_shared(self):
+      import ttt_player
+      cache = ttt_player.RewardCache()
+      p1 = ttt_player.DRPlayer('x', params={'dr' : 0.9})
+      p1.cache = cache
+      move = p1.play(ttt.Board())
+      size = len(cache)
+      p2 = ttt_player.DRPlayer('x', params={'dr' : 0.9})
+      p2.cache = cache
+      misses = cache.misses
+      self.assertEqual(p2.play(ttt.Board()), move)
+      self.assertEqual(cache.misses, misses)
+      # Different parameters do not share rewards
+      p3 = ttt_player.DRPlayer('x', params={'dr' : 0.8})
+      p3.cache = cache
+      p3.play(ttt.Board())
+      self.assertEqual(len(cache), 2*size)
+
+    def test_bounded_and_warm_start(self):
+      import os
+      import tempfile
+      import ttt_player
+      moves = []
+      for maxsize in (None, 200):
+        p = ttt_player.DRPlayer('o')
+        p.cache = ttt_player.RewardCache(maxsize)
+        moves.append([p.play(b) for b in ttt.Board().get_children()])
+        self.assertLessEqual(len(p.cache), maxsize or len(p.cache))
+      self.assertEqual(moves[0], moves[1])
+      with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'rewards')
+        p.cache.save(path)
+        cache = ttt_player.RewardCache()
+        cache.load(path)
+        self.assertEqual(cache.rewards, p.cache.rewards)
+
+class DRPlayerTest(unittest.TestCase):
+
+    def test_ties(self):
+      import ttt_player
+      # Rewards are shared by the orientations of a board, but ties go to the first best move in b's own order
+      p = ttt_player.DRPlayer('x')
+      for b in ttt.Board().get_descendants()[::7] + [ttt.Board()]:
+        if b.next_player() != 'x': continue
+        moves = b.get_empty_idxs()
+        rewards = [p.compute_reward(b.play(move)) for move in moves]
+        self.assertEqual(p.play(b), moves[rewards.index(max(rewards))])
+      # Corners tie, the first in b is played; in the orientation of the canonical board, it would be (2,0)
+      self.assertEqual(p.play(ttt.Board().play(1,1).play(0,0)), (0,2))
+      self.assertEqual(p.play(ttt.Board().play(1,1).play(0,1)), (0,0))
+      # Boards may be given an iteration that disagrees with their marks: the player to move is not the same
+      b = ttt.Board().play(1,1)
+      p.play(b)
+      self.assertEqual(p.play(ttt.Board(b.b, it=2)), ttt_player.DRPlayer('x').play(ttt.Board(b.b, it=2)))
+
+class NegamaxPlayerTest(unittest.TestCase):
+
+    def test_perfect(self):
+      import ttt_player
+      # Every move keeps the game-theoretic value of the board
+      for b in ttt.Board().get_descendants()[::11]:
+        if b.is_over(): continue
+        move = ttt_player.NegamaxPlayer(b.next_player()).play(b)
+        self.assertEqual(ttt_player.solved_db().value(b.play(move)), ttt_player.solved_db().value(b))
+
+    def test_games(self):
+      import ttt_player
+      g = ttt.Game(ttt_player.NegamaxPlayer('x'), ttt_player.NegamaxPlayer('o'))
+      g.start()
+      self.assertEqual(g.b.who_won(), None)
+      for idx in range(0, 5):
+        g = ttt.Game(ttt_player.DPlayer('x'), ttt_player.NegamaxPlayer('o'))
+        g.start()
+        self.assertNotEqual(g.b.who_won(), 'x')
+
+    def test_dtm(self):
+      import ttt_player
+      # x can win at once on (0,2)
+      b = ttt.Board((('x', 'x', ' '), (' ', 'o', ' '), (' ', ' ', 'o')), it=4)
+      self.assertEqual(ttt_player.NegamaxPlayer('x').play(b), (0,2))
+      self.assertEqual(ttt_player.NegamaxPlayer('x', params={'dtm' : 0}).play(b), (0,2))
+      # o loses anyway; with dtm it blocks x's threat instead of losing on the next move
+      b = ttt.Board(((' ', 'x', ' '), (' ', ' ', 'x'), ('o', 'o', 'x')), it=5)
+      self.assertEqual(ttt_player.solved_db().value(b), 'x')
+      self.assertEqual(ttt_player.NegamaxPlayer('o').play(b), (0,2))
+      self.assertEqual(ttt_player.NegamaxPlayer('o', params={'dtm' : 0}).play(b), (1,1))
+
+class MCTSPlayerTest(unittest.TestCase):
+
+    def setUp(self):
+      import random
+      random.seed(0)
+
+    def test_tactics(self):
+      import ttt_player
+      # x wins at once on (0,2)
+      b = ttt.Board((('x', 'x', ' '), (' ', 'o', ' '), (' ', ' ', 'o')), it=4)
+      self.assertEqual(ttt_player.MCTSPlayer('x').play(b), (0,2))
+      # o must block on (0,2)
+      b = ttt.Board((('x', 'x', ' '), (' ', 'o', ' '), (' ', ' ', ' ')), it=3)
+      self.assertEqual(ttt_player.MCTSPlayer('o').play(b), (0,2))
+
+    def test_games(self):
+      import ttt_player
+      for idx in range(0, 3):
+        g = ttt.Game(ttt_player.NegamaxPlayer('x'), ttt_player.MCTSPlayer('o'))
+        g.start()
+        self.assertEqual(g.b.who_won(), None)
+      g = ttt.Game(ttt_player.MCTSPlayer('x', params={'iterations' : 200}), ttt_player.DPlayer('o'),
+                   b=ttt.MNKBoard(m=5, n=5, k=4))
+      g.start()
+      self.assertTrue(g.b.is_over())
+
+    def test_tree_reuse(self):
+      import ttt_player
+      p = ttt_player.MCTSPlayer('x', params={'iterations' : 500})
+      b = ttt.Board()
+      b = b.play(p.play(b))
+      node = p.root.children[b.get_empty_idxs()[0]]
+      b = b.play(b.get_empty_idxs()[0])
+      visits = node.visits
+      self.assertGreater(visits, 0)
+      self.assertIs(p.find_root(b), node)
+      p.play(b)
+      self.assertEqual(node.visits, visits + 500) # The search went on from the kept node
+      p.start()
+      self.assertIsNot(p.find_root(b), node)
+
+    def test_budgets(self):
+      import time
+      import ttt_player
+      p = ttt_player.MCTSPlayer('x', params={'time' : 0.05})
+      t = time.perf_counter()
+      p.play(ttt.Board())
+      self.assertLess(time.perf_counter() - t, 1)
+      self.assertGreater(p.rollouts, 0)
+      p = ttt_player.MCTSPlayer('x', params={'iterations' : 300, 'workers' : 2})
+      b = ttt.Board().play(0,0).play(0,1)
+      self.assertIn(p.play(b), b.get_empty_idxs())
+      self.assertEqual(p.rollouts, 300)
+      ttt_player.MCTSPlayer.close()
+      self.assertEqual(ttt_player.MCTSPlayer.executors, {})
+      b = b.play(1,1).play(2,2)
+      self.assertIn(p.play(b), b.get_empty_idxs()) # On a new pool
+      ttt_player.MCTSPlayer.close()
+
+class TrainTest(unittest.TestCase):
+
+    def test_states(self):
+      import ttt_train
+      index = ttt_train.StateIndex()
+      self.assertEqual(len(index), 765)
+      self.assertEqual(index.id_of(ttt.Board()), 0)
+      b = ttt.Board().play(0,0)
+      self.assertEqual(index.id_of(b), index.id_of(b.transform(3)))
+      self.assertIn(index.id_of(b), index.children[0])
+      self.assertEqual(len(index.children[0]), 3) # Center, corner and edge
+
+    def test_converges(self):
+      import ttt_train
+      import ttt_player
+      trainer = ttt_train.Trainer(eps=0.1, lr=0.5, lr_decay=1e-4, seed=1)
+      start = trainer.evaluate()[3]
+      trainer.train(20000)
+      episode, seconds, lr, optimal, change = trainer.evaluate()
+      self.assertEqual(episode, 20000)
+      self.assertLess(lr, 0.5)
+      self.assertGreater(optimal, max(start, 0.95))
+      g = ttt.Game(ttt_player.NegamaxPlayer('x'), trainer.player('o'))
+      g.start()
+      self.assertNotEqual(g.b.who_won(), 'x')
+
+    def test_resume(self):
+      import os
+      import tempfile
+      import ttt_train
+      import ttt_player
+      index = ttt_train.StateIndex()
+      trainer = ttt_train.Trainer(index, seed=2)
+      trainer.train(2000)
+      with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'checkpoint')
+        trainer.save(path)
+        resumed = ttt_train.Trainer(index)
+        resumed.load(path)
+      self.assertEqual(resumed.episode, 2000)
+      trainer.train(1000)
+      resumed.train(1000)
+      self.assertEqual(resumed.values, trainer.values)
+      # Against an opponent, the learner plays both marks
+      trainer = ttt_train.Trainer(index, opponent=ttt_player.DPlayer)
+      trainer.train(20)
+      self.assertEqual(trainer.episode, 20)
+      # and the opponent's random moves resume too, whatever else draws from the random module
+      with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'checkpoint')
+        trainer.save(path)
+        resumed = ttt_train.Trainer(index, opponent=ttt_player.DPlayer)
+        resumed.load(path)
+      import random
+      trainer.train(30)
+      random.random()
+      resumed.train(30)
+      self.assertEqual(resumed.values, trainer.values)
+
+    def test_rlplayer_random(self):
+      import random
+      import ttt_player
+      # RLPlayer draws from its own random numbers, and only to break ties
+      random.seed(3)
+      state = random.getstate()
+      p = ttt_player.RLPlayer('x', params={'eps' : 0.5})
+      g = ttt.Game(p, ttt_player.RLPlayer('o'))
+      g.start()
+      self.assertEqual(random.getstate(), state)
+      p = ttt_player.RLPlayer('o')
+      b = ttt.Board().play(0,0).play(1,1).play(0,1)
+      p.rewards = {c.canonical()[0] : 0.1 for c in b.get_children()}
+      p.rewards[b.play(2,2).canonical()[0]] = 0.9
+      rng = p.rng.getstate()
+      self.assertEqual(p.play(b), (2,2))
+      self.assertEqual(p.rng.getstate(), rng)
+
+    def test_rlplayer_children(self):
+      import ttt_player
+      # Children are kept by board and by the player to move, which the iteration tells
+      r = ttt_player.RLPlayer('x')
+      b = ttt.Board().play(1,1)
+      r.play(b)
+      c = ttt.Board(b.b, it=2)
+      self.assertEqual(r.children(c)[0], c.get_children())
+      self.assertEqual(r.children(b)[0], b.get_children())
+
+class ValuesTest(unittest.TestCase):
+
+    def setUp(self):
+      import tempfile
+      self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+      self.dir.cleanup()
+
+    def test_drplayer(self):
+      import os
+      import ttt_player
+      path = os.path.join(self.dir.name, 'rewards')
+      p = ttt_player.DRPlayer('o', params={'dr' : 0.9})
+      p.save(path)
+      self.assertEqual(os.path.getsize(path) % 4, 0)
+      bs = [b for b in ttt.Board().get_descendants()[1::20] if not b.is_over() and b.next_player() == 'o']
+      moves = [p.play(b) for b in bs]
+      ttt_player.DRPlayer.cache.clear()
+      q = ttt_player.DRPlayer('o')
+      q.load(path)
+      self.assertEqual(q.params['dr'], 0.9)
+      self.assertEqual([q.play(b) for b in bs], moves)
+      self.assertEqual(ttt_player.DRPlayer.cache.misses, 0) # Nothing was computed by q
+      self.assertRaises(ValueError, ttt_player.DRPlayer('x').load, path)
+      self.assertRaises(ValueError, ttt_player.RLPlayer('o').load, path)
+
+    def test_rlplayer(self):
+      import os
+      import ttt_player
+      import ttt_values
+      path = os.path.join(self.dir.name, 'values')
+      p = ttt_player.RLPlayer('x', params={'lr' : 0.1})
+      g = ttt.Game(p, ttt_player.DPlayer('o'))
+      g.start()
+      p.save(path)
+      q = ttt_player.RLPlayer('x')
+      q.load(path)
+      self.assertEqual(q.params['lr'], 0.1)
+      self.assertEqual(len(list(q.table.items())), len(p.rewards))
+      for cc in p.rewards:
+        self.assertAlmostEqual(q.table.get(cc), p.rewards[cc], places=6)
+      with open(path, 'r+b') as f:
+        f.write(b'XXXX')
+      self.assertRaises(ValueError, ttt_values.load, path)
+
+class ServerTest(unittest.TestCase):
+
+    def test_games(self):
+      import asyncio
+      import ttt_server
+
+      async def run():
+        server = ttt_server.Server(workers=0)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+          rate, p50, p99 = await ttt_server.run_load('127.0.0.1', port, 'DPlayer', 4, 3)
+          self.assertEqual(server.games, 12)
+          self.assertGreater(rate, 0)
+          self.assertLessEqual(p50, p99)
+          await ttt_server.run_load('127.0.0.1', port, 'MCTSPlayer', 2, 1, ['iterations=50'])
+          await ttt_server.run_load('127.0.0.1', port, 'RLPlayer', 2, 2)
+          reader, writer = await asyncio.open_connection('127.0.0.1', port)
+          replies = []
+          for line in ('NEW NegamaxPlayer o', 'MOVE 1 1', 'MOVE 0 0', 'BOARD', 'NEW DRPlayer x dr=2', 'FOO'):
+            writer.write((line + '\n').encode())
+            replies.append((await reader.readline()).decode().split())
+            if line == 'NEW NegamaxPlayer o': replies.append((await reader.readline()).decode().split())
+          writer.close()
+          return replies
+        finally:
+          listener.close()
+          await listener.wait_closed()
+          server.close()
+
+      replies = asyncio.run(run())
+      self.assertEqual(replies[0], ['OK', 'o'])
+      self.assertEqual(replies[1][0], 'MOVE') # The engine plays first
+      self.assertEqual(replies[2][0], 'ERR' if replies[1] == ['MOVE', '1', '1'] else 'MOVE')
+      self.assertEqual(replies[4][0], 'BOARD')
+      self.assertEqual(replies[5][0], 'ERR')
+      self.assertEqual(replies[6][0], 'ERR')
+
+    def test_failures(self):
+      import os
+      import asyncio
+      import ttt_server
+
+      async def run():
+        server = ttt_server.Server(workers=1)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        replies = []
+        try:
+          reader, writer = await asyncio.open_connection('127.0.0.1', port)
+          async def send(line):
+            writer.write((line + '\n').encode())
+            replies.append((await reader.readline()).decode().split())
+          await send('NEW RLPlayer')
+          await send('MOVE 1 1')
+          # A worker dies: the move fails, leaving the game as it was, and is played again on a new pool
+          try: server.executor.submit(os._exit, 1).result()
+          except Exception: pass
+          await send('MOVE 0 0')
+          await send('MOVE 0 0')
+          # A line longer than the reader's limit ends the connection
+          await send('X' * 100000)
+          replies.append(await reader.readline())
+          writer.close()
+          return replies
+        finally:
+          listener.close()
+          await listener.wait_closed()
+          server.close()
+
+      replies = asyncio.run(run())
+      self.assertEqual(replies[0], ['OK', 'x'])
+      self.assertEqual(replies[1][0], 'MOVE')
+      self.assertEqual(replies[2][0], 'ERR')
+      self.assertEqual(replies[3][0], 'MOVE')
+      self.assertEqual(replies[4][0], 'ERR')
+      self.assertEqual(replies[5], b'')
+
+class GameLogTest(unittest.TestCase):
+
+    def setUp(self):
+      import tempfile
+      self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+      self.dir.cleanup()
+
+    def test_round_trip(self):
+      import os
+      import ttt_log
+      import ttt_player
+      path = os.path.join(self.dir.name, 'games')
+      games = []
+      with ttt_log.GameLog(path) as log:
+        for p1,p2 in ((ttt_player.DPlayer('x'), ttt_player.DPlayer('o')),
+                      (ttt_player.NegamaxPlayer('x'), ttt_player.DRPlayer('o', params={'dr' : 0.9}))):
+          for idx in range(0, 5):
+            g = ttt.Game(p1, p2, log=log)
+            g.start()
+            games.append(g)
+      with ttt_log.GameLog(path) as log: # Appending
+        g = ttt.Game(ttt_player.DPlayer('o'), ttt_player.DPlayer('x'), log=log)
+        g.start()
+        games.append(g)
+      for chunk in (1, 3, 1 << 16):
+        logged = list(ttt_log.read(path, chunk))
+        self.assertEqual(len(logged), len(games))
+        for lg,g in zip(logged, games):
+          self.assertEqual(lg.moves, tuple(g.moves))
+          self.assertEqual(lg.winner, g.b.who_won())
+          self.assertEqual([p[:2] for p in lg.players], [[type(g.ps[0]).__name__, g.ps[0].p], [type(g.ps[1]).__name__, g.ps[1].p]])
+      self.assertEqual(logged[-2].players[1][2]['dr'], 0.9)
+      self.assertEqual(sum(ttt_log.summarize(path)[('DPlayer', 'DPlayer')].values()), 6)
+      with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+      self.assertRaises(ValueError, list, ttt_log.read(path))
+      self.assertRaises(ValueError, ttt.Game(ttt_player.DPlayer('x'), ttt_player.DPlayer('o'),
+                                             b=ttt.Board().play(1,1), log=ttt_log.GameLog(path)).start)
+
+    def test_compact(self):
+      import ttt_log
+      moves = [(1,1), (0,0), (0,1), (2,1), (2,0), (0,2), (1,2), (1,0), (2,2)]
+      self.assertEqual(len(ttt_log.pack_game(moves, ttt_log.NO_WINNER)), 5)
+      self.assertEqual(len(ttt_log.pack_game(moves[:5], ttt_log.FIRST_WON)), 3)
+
+    def test_tournament(self):
+      import io
+      import experiment
+      import ttt_log
+      import ttt_player
+      configs = (((ttt_player.DPlayer, 'x'), (ttt_player.DPlayer, 'o')),
+                 ((ttt_player.ADPlayer, 'x'), (ttt_player.DPlayer, 'o')))
+      logs = []
+      for workers in (1, 2):
+        log = ttt_log.GameLog(io.BytesIO())
+        experiment.run_tournament(configs, games=6, workers=workers, chunk=4, log=log)
+        logs.append(log.f.getvalue())
+      self.assertEqual(logs[0], logs[1])
+
+class TablePlayerTest(unittest.TestCase):
+
+    def test_compile(self):
+      import ttt_player
+      p = ttt_player.DRPlayer('o', params={'dr' : 0.9})
+      tp = ttt_player.compile_player(p)
+      bs = [b for b in ttt.Board().get_descendants() if not b.is_over() and b.next_player() == 'o']
+      self.assertEqual([tp.play(b) for b in bs], [p.play(b) for b in bs])
+      # Players with the same class, mark and params share a table
+      self.assertIs(ttt_player.compile_player(ttt_player.DRPlayer('o', params={'dr' : 0.9})).table, tp.table)
+      self.assertIsNot(ttt_player.compile_player(ttt_player.DRPlayer('o')).table, tp.table)
+      # Boards outside the table are left to the player
+      b = ttt.Board(p1='a', p2='b').play(1,1)
+      self.assertEqual(tp.play(b), p.play(b))
+
+    def test_stale(self):
+      import ttt_player
+      # A table found for the same class, mark and params is checked, and built again if the player differs
+      p = ttt_player.DRPlayer('x', params={'dr' : 0.8})
+      table = ttt_player.compile_player(p).table
+      b = ttt.Board()
+      table[b.encode()] = 0 if p.play(b) != (0,0) else 1
+      tp = ttt_player.compile_player(ttt_player.DRPlayer('x', params={'dr' : 0.8}))
+      self.assertIsNot(tp.table, table)
+      self.assertEqual(tp.play(b), p.play(b))
+      self.assertIs(ttt_player.compile_player(p, verify=False).table, tp.table)
+
+    def test_game(self):
+      import ttt_player
+      g = ttt.Game(ttt_player.compile_player(ttt_player.NegamaxPlayer('x')),
+                   ttt_player.compile_player(ttt_player.ADPlayer('o')))
+      g.start()
+      self.assertNotEqual(g.b.who_won(), 'o')
+
+    def test_not_deterministic(self):
+      import random
+      import ttt_player
+      random.seed(0)
+      self.assertRaises(ValueError, ttt_player.compile_player, ttt_player.DPlayer('x'))
+      self.assertEqual([k for k in ttt_player.TablePlayer.tables if k[0] == 'DPlayer'], [])
+
+class GamePoolTest(unittest.TestCase):
+
+    def test_same_as_game(self):
+      import ttt_player
+      g = ttt.Game(ttt_player.DRPlayer('x'), ttt_player.ADPlayer('o'))
+      g.start()
+      pool = ttt.GamePool(ttt_player.DRPlayer('x'), ttt_player.ADPlayer('o'), 5)
+      self.assertEqual(pool.start(), len(g.moves))
+      self.assertEqual([h.moves for h in pool.games], [g.moves] * 5)
+
+    def test_rlplayer(self):
+      import random
+      import ttt_player
+      random.seed(4)
+      p = ttt_player.RLPlayer('x')
+      g = ttt.Game(p, ttt_player.DPlayer('o'))
+      g.start()
+      random.seed(4)
+      q = ttt_player.RLPlayer('x')
+      pool = ttt.GamePool(q, ttt_player.DPlayer('o'), 1)
+      pool.start()
+      self.assertEqual(pool.games[0].moves, g.moves)
+      self.assertEqual(q.rewards, p.rewards)
+      # Games played together learn each from its own previous move
+      pool = ttt.GamePool(q, ttt_player.DPlayer('o'), 50)
+      pool.start()
+      self.assertTrue(all(h.b.is_over() for h in pool.games))
+      self.assertEqual(len(q.prev_bs), 50)
+
+    def test_rlplayer_both_seats(self):
+      import ttt_player
+      p = ttt_player.RLPlayer('x')
+      g = ttt.Game(p, p)
+      g.start()
+      q = ttt_player.RLPlayer('x')
+      pool = ttt.GamePool(q, q, 1)
+      pool.start()
+      self.assertEqual(pool.games[0].moves, g.moves)
+      self.assertEqual(sorted(q.prev_bs), [(0, 'o'), (0, 'x')])
+      # Each seat learns from its own previous move
+      r = ttt_player.RLPlayer('x')
+      prev = {'x' : None, 'o' : None}
+      b = ttt.Board()
+      for move in g.moves:
+        m, prev[b.next_player()] = r.move(b, prev[b.next_player()], *r.children(b))
+        self.assertEqual(m, move)
+        b = b.play(move)
+      self.assertEqual(p.rewards, r.rewards)
+      self.assertEqual(q.rewards, r.rewards)
+
+    def test_defend_moves(self):
+      import ttt_player
+      # Batches of boards are looked at all at once with numpy, one board at a time without it
+      for root in (ttt.Board(), ttt.BitBoard(), ttt.Board(e='.', p1='a', p2='b')):
+        bs = root.get_descendants()
+        bs += [ttt.Board(b.b, b.e, b.p1, b.p2, b.it + 1) for b in bs[::50]]
+        for p in (root.p1, root.p2, 'z'):
+          for win in (False, True):
+            self.assertEqual(ttt_player.defend_moves(bs, p, win), [ttt_player.defend_move(b, p, win) for b in bs])
+
+    def test_play_batch(self):
+      import random
+      import ttt_player
+      bs = [b for b in ttt.Board().get_descendants() if not b.is_over()][::11] * 2
+      bs += [b for b in ttt.BitBoard().get_descendants() if not b.is_over()][::29]
+      bs += [ttt.Board(bs[100].b, it=bs[100].it + 1), ttt.Board(bs[100].b, it=bs[100].it)]
+      others = [b for b in ttt.Board(e='.', p1='a', p2='b').get_descendants() if not b.is_over()][::23]
+      others += [ttt.MNKBoard(m=3, n=4, k=3).play(0,0), ttt.MNKBoard(m=3, n=4, k=3).play(1,3).play(0,0)]
+      players = (ttt_player.DPlayer('x'), ttt_player.APlayer('o'), ttt_player.ADPlayer('x'),
+                 ttt_player.DRPlayer('o'), ttt_player.NegamaxPlayer('x'))
+      for p in players:
+        cases = bs if isinstance(p, (ttt_player.APlayer, ttt_player.ADPlayer)) else bs + others
+        for idx in range(0, 2): # Then from the tables
+          random.seed(1)
+          moves = p.play_batch(cases)
+          random.seed(1)
+          self.assertEqual(moves, [tuple(p.play(b)) for b in cases])
+
+class TournamentTest(unittest.TestCase):
+
+    def test_parallel_matches_serial(self):
+      import experiment
+      import ttt_player
+      configs = (
+        ((ttt_player.DPlayer, 'x'), (ttt_player.DPlayer, 'o')),
+        ((ttt_player.ADPlayer, 'x'), (ttt_player.DPlayer, 'o')),
+        ((ttt_player.DRPlayer, 'x', {'dr' : 0.9}), (ttt_player.DPlayer, 'o')),
+      )
+      import random
+      random.seed(1)
+      state = random.getstate()
+      serial = experiment.run_tournament(configs, games=25, workers=1, seed=7, chunk=4)
+      self.assertEqual(random.getstate(), state) # The caller's random numbers are left alone
+      parallel = experiment.run_tournament(configs, games=25, workers=2, seed=7, chunk=4)
+      self.assertEqual(serial, parallel)
+      for res in serial:
+        self.assertEqual(sum(res.values()), 25)
+
+    def test_sprt(self):
+      import experiment
+      p = experiment.Pairing('a', 'b', 0, 0, 0, 0.0, 0.0, None)
+      self.assertEqual(experiment.sprt(p._replace(wins=30, draws=10), 50, 0.05, 0.05)[2], 'a')
+      self.assertEqual(experiment.sprt(p._replace(losses=30, draws=10), 50, 0.05, 0.05)[2], 'b')
+      self.assertEqual(experiment.sprt(p._replace(draws=20), 50, 0.05, 0.05)[2], 'even')
+      self.assertEqual(experiment.sprt(p._replace(wins=3, draws=2, losses=2), 50, 0.05, 0.05)[2], None)
+
+    def test_round_robin(self):
+      import experiment
+      import ttt_player
+      entrants = [experiment.parse_entrant(e) for e in ('APlayer', 'NegamaxPlayer', 'DRPlayer:dr=0.9')]
+      self.assertEqual(experiment.entrant_name(entrants[2]), 'DRPlayer(dr=0.9)')
+      pairings, ratings = experiment.round_robin(entrants, min_games=10, chunk=5, workers=1)
+      self.assertEqual([(p.a, p.b, p.decision) for p in pairings],
+                       [('APlayer', 'NegamaxPlayer', 'b'), ('APlayer', 'DRPlayer(dr=0.9)', 'b'),
+                        ('NegamaxPlayer', 'DRPlayer(dr=0.9)', 'even')])
+      self.assertTrue(all(p.wins + p.draws + p.losses == 10 for p in pairings))
+      self.assertAlmostEqual(sum(r.elo for r in ratings), 0)
+      self.assertLess(ratings[0].high, ratings[1].low)
+      self.assertAlmostEqual(ratings[1].elo, ratings[2].elo)
+      self.assertRaises(ValueError, experiment.parse_entrant, 'DRPlayer:gamma=2')
+
+@unittest.skipIf(numpy == None, "requires numpy")
+class SweepTest(unittest.TestCase):
+
+    def test_same_as_drplayer(self):
+      import ttt_sweep
+      import ttt_player
+      settings = ttt_sweep.grid(dr=(0.3, 0.96), tie=(0, 0.5), los=(-1, -3))
+      sweep = ttt_sweep.Sweep('o', settings)
+      bs = [b for b in ttt.Board().get_descendants() if b.next_player() == 'o']
+      for i,setting in enumerate(settings):
+        p = ttt_player.DRPlayer('o', params=setting)
+        # Bit for bit the rewards of DRPlayer, so the same moves, ties included
+        self.assertEqual([p.compute_reward(b) for b in sweep.graph.boards], sweep.rewards[:, i].tolist())
+        q = sweep.player(i)
+        self.assertEqual([q.play(b) for b in bs], [p.play(b) for b in bs])
+      self.assertEqual(sorted(i for group in sweep.groups() for i in group), list(range(0, len(settings))))
+      # Settings grouped together play alike on every board, not only on the canonical ones
+      for group in sweep.groups():
+        q = sweep.player(group[0])
+        for i in group[1:]:
+          self.assertEqual([q.play(b) for b in bs], [sweep.player(i).play(b) for b in bs])
+
+@unittest.skipIf(numpy == None, "requires numpy")
+class BoardBatchTest(unittest.TestCase):
+
+    def test_agrees_with_board(self):
+      import ttt_batch
+      bs = ttt.Board().get_descendants()
+      batch = ttt_batch.BoardBatch.from_boards(bs)
+      self.assertEqual(batch.to_boards(), bs)
+      num = {None : 0, 'x' : 1, 'o' : 2}
+      who_won = batch.who_won()
+      next_player = batch.next_player()
+      is_over = batch.is_over()
+      legal = batch.legal_moves()
+      for n,b in enumerate(bs):
+        self.assertEqual(who_won[n], num[b.who_won()])
+        self.assertEqual(next_player[n], num[b.next_player()])
+        self.assertEqual(is_over[n], b.is_over())
+        empty = b.get_empty_idxs() if not b.is_over() else []
+        self.assertEqual([(k // 3, k % 3) for k in range(0, 9) if legal[n, k]], empty)
+      # Play (1,2) on every board where it is legal
+      played = batch.play(numpy.where(legal[:, 5], 5, -1)).to_boards()
+      for n,b in enumerate(bs):
+        self.assertEqual(played[n], b.play(1,2) if legal[n, 5] else b)
+
+    def test_play(self):
+      import ttt_batch
+      batch = ttt_batch.BoardBatch.empty(2).play([0, 4]).play([4, -1])
+      self.assertEqual(batch.to_boards(), [ttt.Board().play(0,0).play(1,1), ttt.Board().play(1,1)])
+      self.assertRaises(RuntimeWarning, batch.play, [8, 4])
+
+    def test_defend(self):
+      import random
+      import ttt_batch
+      import ttt_player
+      bs = [b for b in ttt.Board().get_descendants() if not b.is_over()]
+      moves = ttt_batch.defend_moves(ttt_batch.BoardBatch.from_boards(bs), numpy.random.default_rng(0))
+      for n,b in enumerate(bs):
+        # Where DPlayer defends, it makes the same move whatever the random seed
+        random.seed(0)
+        move = ttt_player.DPlayer(b.next_player()).play(b)
+        random.seed(1)
+        if ttt_player.DPlayer(b.next_player()).play(b) == move and len(b.get_empty_idxs()) > 1:
+          self.assertEqual(moves[n], 3*move[0] + move[1])
+
+    def test_play_games(self):
+      import ttt_batch
+      batch = ttt_batch.play_games(1000, 'defend', 'random', numpy.random.default_rng(0))
+      self.assertTrue(batch.is_over().all())
+      for b in batch.to_boards()[:100]:
+        self.assertTrue(b.is_over())
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_compare(self):
+      import io
+      import contextlib
+      import benchmark
+      baseline = {'a' : {'value' : 1.0}, 'b' : {'value' : 2.0}, 'r' : {'value' : 100.0}, 's' : {'value' : 100.0}}
+      results = {'a' : {'unit' : 'us', 'value' : 1.1}, 'b' : {'unit' : 'us', 'value' : 3.0},
+                 'c' : {'unit' : 'us', 'value' : 1.0},
+                 'r' : {'unit' : 'games/s', 'value' : 70.0}, 's' : {'unit' : 'games/s', 'value' : 150.0}}
+      with contextlib.redirect_stdout(io.StringIO()):
+        self.assertEqual(benchmark.compare(results, baseline, 0.25), ['b', 'r']) # Fewer games per second is worse
+        self.assertEqual(benchmark.compare(results, baseline, 0.05), ['a', 'b', 'r'])
+
+class StatsTest(unittest.TestCase):
+
+    def tearDown(self):
+      ttt.disable_stats()
+
+    def test_disabled(self):
+      self.assertEqual(ttt.stats, None)
+      ttt.Board().get_descendants()
+      self.assertEqual(ttt.disable_stats(), None)
+
+    def test_counters(self):
+      import ttt_player
+      stats = ttt.enable_stats()
+      ttt.Board().get_children()
+      self.assertEqual(stats.boards, 10)
+      ttt.BitBoard(((' ', ' ', ' '), (' ', 'x', ' '), (' ', ' ', ' ')), it=1)
+      ttt.BitBoard.from_masks(0, 0)
+      self.assertEqual(stats.boards, 12)
+      ttt.BitBoard().get_descendants()
+      self.assertEqual(stats.descendants_visited, 5478)
+      p = ttt_player.DRPlayer('x', params={'dr' : 0.5})
+      p.cache = ttt_player.RewardCache()
+      g = ttt.Game(p, ttt_player.RLPlayer('o'))
+      g.start()
+      self.assertIs(ttt.disable_stats(), stats)
+      self.assertEqual(stats.moves['Discounted reward player (x)'][0], (g.b.it + 1) // 2)
+      self.assertEqual(stats.moves['Reinforcement learning player (o)'][0], g.b.it // 2)
+      self.assertEqual(stats.caches['DRPlayer.rewards'][1], len(p.cache))
+      self.assertEqual(sum(stats.caches['RLPlayer.rewards']), sum(9 - it for it in range(1, g.b.it, 2)))
+      self.assertIn('Cache DRPlayer.rewards', str(stats))
+      self.assertEqual(stats.as_dict()['boards'], stats.boards)
+
+    def test_tournament(self):
+      import experiment
+      import ttt_player
+      configs = (((ttt_player.DPlayer, 'x'), (ttt_player.ADPlayer, 'o')),)
+      stats = [ttt.Stats(), ttt.Stats()]
+      experiment.run_tournament(configs, games=6, workers=1, chunk=2, stats=stats[0])
+      experiment.run_tournament(configs, games=6, workers=2, chunk=2, stats=stats[1])
+      self.assertEqual(ttt.stats, None)
+      self.assertEqual(stats[0].boards, stats[1].boards)
+      self.assertEqual({p : m[0] for p,m in stats[0].moves.items()}, {p : m[0] for p,m in stats[1].moves.items()})
+      # Statistics the caller records are kept, and include the games played in its process
+      outer = ttt.enable_stats()
+      ttt.Board().get_children()
+      experiment.run_tournament(configs, games=6, workers=1, chunk=2, stats=ttt.Stats())
+      self.assertIs(ttt.stats, outer)
+      self.assertEqual(outer.boards, 10 + stats[0].boards)
+
 
 if __name__ == "__main__":
   test = unittest.TestLoader().loadTestsFromName("ttt_test.TttTest.test_get_input")
@@ -0,0 +1,291 @@
+'''Offline training of RLPlayer.
+
+The learner keeps, for each player, the value of every state reached after its
+own moves, and updates the value of its previous state towards the value of
+its next one (temporal-difference learning, as RLPlayer does while playing).
+States are the canonical boards (see Board.canonical()) reachable from the
+empty board, numbered densely by StateIndex, so that values live in flat
+arrays and an episode of self-play is a handful of list lookups.
+
+Moves are epsilon-greedy: with probability eps a random move is played, and
+not learned from.  The learn rate decreases as lr / (1 + lr_decay * episode),
+down to lr_min.
+
+Training reports episodes per second and, every eval_every episodes, a point of
+the convergence curve: the fraction of states where the greedy move keeps the
+game-theoretic value of the board (from the solved-state database), and the
+mean change of the values since the previous point.  Checkpoints hold the
+values, the curve and the random states, so that training can be stopped and
+resumed where it stopped.  Opponents draw from the random module: while they
+play, it holds a state of their own, seeded like the learner's.
+'''
+
+__author__ ="Daniel S. Fava"
+__license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
+__year__   ="2018"
+
+import os
+import sys
+import time
+import array
+import pickle
+import random
+import argparse
+
+import ttt
+import ttt_db
+import ttt_player
+
+CHECKPOINT_VERSION = 1
+
+class StateIndex():
+  '''Dense numbering of the canonical boards reachable from a board, and the moves between them.'''
+
+  def __init__(self, root=None):
+    if root == None: root = ttt.Board()
+    self.boards = root.get_descendants(canonical=True) # State -> canonical board; the root is state 0
+    self.ids = {b : n for n,b in enumerate(self.boards)}
+    # Children of each state, without the duplicates due to symmetric moves
+    self.children = [tuple(sorted(set(self.ids[c.canonical()[0]] for c in b.get_children()))) for b in self.boards]
+    self.winner = [b.who_won() for b in self.boards]
+    self.over = [b.is_over() for b in self.boards]
+    self.p1 = root.p1
+    self.p2 = root.p2
+
+  def __len__(self):
+    return len(self.boards)
+
+  def id_of(self, b):
+    '''State of board b, which is any rotation or reflection of a board reachable from the root.'''
+    try: return self.ids[b]
+    except KeyError: pass
+    n = self.ids[b.canonical()[0]]
+    self.ids[b] = n
+    return n
+
+  def initial_values(self, p):
+    '''Values before learning, as in RLPlayer: 1 for a win of p, 0 for a loss, 0.5 otherwise.'''
+    return array.array('d', (1.0 if w == p else 0.0 if w != None else 0.5 for w in self.winner))
+
+class Trainer():
+
+  def __init__(self, index=None, eps=0.1, lr=0.5, lr_decay=0.0, lr_min=0.0, opponent=None, seed=0):
+    '''Train values for both players of index (a StateIndex of the empty board by default).
+If opponent is None, learn from self-play; otherwise it is a player class, and the learner
+plays p1 and p2 against it on alternate episodes.'''
+    self.index = index if index != None else StateIndex()
+    self.eps = eps
+    self.lr0 = lr
+    self.lr_decay = lr_decay
+    self.lr_min = lr_min
+    self.opponent = opponent
+    self.rng = random.Random(seed)
+    self.opponent_random = random.Random('%s-opponent' % seed).getstate() # State of the random module for opponents
+    self.values = {p : self.index.initial_values(p) for p in (self.index.p1, self.index.p2)}
+    self.episode = 0 # Episodes played so far
+    self.seconds = 0.0 # Time spent playing them
+    # Points of the convergence curve: (episode, seconds, lr, fraction of optimal moves, mean value change)
+    self.curve = []
+    self._last_values = None
+    self._values_db = None
+
+  def lr(self):
+    return max(self.lr_min, self.lr0 / (1 + self.lr_decay * self.episode))
+
+  def choose(self, v, cs):
+    '''Epsilon-greedy choice among states cs valued by v; return (state, True if the move was exploratory).'''
+    if self.rng.random() < self.eps:
+      return self.rng.choice(cs), True
+    best = max(v[c] for c in cs)
+    return self.rng.choice([c for c in cs if v[c] == best]), False
+
+  def self_play(self):
+    '''Play one episode of the learner against itself.'''
+    index = self.index
+    lr = self.lr()
+    values = (self.values[index.p1], self.values[index.p2])
+    prev = [None, None]
+    s = 0
+    it = 0
+    while not index.over[s]:
+      v = values[it % 2]
+      c, explored = self.choose(v, index.children[s])
+      p = prev[it % 2]
+      if p != None and not explored:
+        v[p] += lr * (v[c] - v[p])
+      prev[it % 2] = c
+      s = c
+      it += 1
+    self._finish(values, prev, s, lr)
+
+  def opponent_play(self, players):
+    '''Play one episode of the learner against players, a dict mark -> player.'''
+    index = self.index
+    lr = self.lr()
+    me = index.p1 if self.episode % 2 == 0 else index.p2
+    v = self.values[me]
+    adv = players[index.p2 if me == index.p1 else index.p1]
+    adv.start()
+    b = ttt.Board(e=index.boards[0].e, p1=index.p1, p2=index.p2)
+    prev = None
+    while not b.is_over():
+      if b.next_player() == me:
+        cs = b.get_children()
+        c, explored = self.choose(v, [index.id_of(c) for c in cs])
+        if prev != None and not explored:
+          v[prev] += lr * (v[c] - v[prev])
+        prev = c
+        b = self.rng.choice([nb for nb in cs if index.id_of(nb) == c])
+      else:
+        b = b.play(adv.play(b))
+    if prev != None: v[prev] += lr * (v[index.id_of(b)] - v[prev])
+
+  def _finish(self, values, prev, s, lr):
+    # The game is over: the last states of both players move towards the final state
+    for v,p in zip(values, prev):
+      if p != None: v[p] += lr * (v[s] - v[p])
+
+  def train(self, episodes):
+    '''Play episodes more episodes.'''
+    start = time.perf_counter()
+    if self.opponent == None:
+      for idx in range(0, episodes):
+        self.self_play()
+        self.episode += 1
+    else:
+      players = {p : self.opponent(p) for p in (self.index.p1, self.index.p2)}
+      state = random.getstate()
+      random.setstate(self.opponent_random)
+      try:
+        for idx in range(0, episodes):
+          self.opponent_play(players)
+          self.episode += 1
+      finally:
+        self.opponent_random = random.getstate()
+        random.setstate(state)
+    self.seconds += time.perf_counter() - start
+
+  def optimal_fraction(self):
+    '''Fraction of the states not over where the greedy move keeps the value of the game, None for boards the
+database does not hold.  The database is built on first use if missing.'''
+    index = self.index
+    if not ttt_db.compatible(index.boards[0]): return None
+    db = ttt_player.solved_db(build=True)
+    if self._values_db == None:
+      self._values_db = [db.value(b) for b in index.boards]
+    optimal = 0
+    total = 0
+    for s in range(0, len(index)):
+      if index.over[s]: continue
+      v = self.values[index.boards[s].next_player()]
+      c = max(index.children[s], key=lambda c: v[c])
+      optimal += self._values_db[c] == self._values_db[s]
+      total += 1
+    return optimal / total
+
+  def _flat_values(self):
+    return [x for p in sorted(self.values) for x in self.values[p]]
+
+  def evaluate(self):
+    '''Add a point to the convergence curve and return it.'''
+    values = self._flat_values()
+    if self._last_values == None: change = float('nan')
+    else: change = sum(abs(x - y) for x,y in zip(values, self._last_values)) / len(values)
+    self._last_values = values
+    point = (self.episode, self.seconds, self.lr(), self.optimal_fraction(), change)
+    self.curve.append(point)
+    return point
+
+  def player(self, p, params={}):
+    '''An RLPlayer for mark p that starts from the learned values.'''
+    pl = ttt_player.RLPlayer(p, params)
+    pl.rewards = {b : self.values[p][n] for n,b in enumerate(self.index.boards)}
+    return pl
+
+  def save(self, path):
+    '''Write a checkpoint to path.'''
+    state = {'version' : CHECKPOINT_VERSION,
+             'params' : {'eps' : self.eps, 'lr' : self.lr0, 'lr_decay' : self.lr_decay, 'lr_min' : self.lr_min},
+             'episode' : self.episode,
+             'seconds' : self.seconds,
+             'values' : {p : self.values[p].tobytes() for p in self.values},
+             'curve' : self.curve,
+             'random' : self.rng.getstate(),
+             'opponent_random' : self.opponent_random}
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+      pickle.dump(state, f)
+    os.replace(tmp, path)
+
+  def load(self, path):
+    '''Resume from the checkpoint at path, written by save() for the same index.'''
+    with open(path, 'rb') as f:
+      state = pickle.load(f)
+    if state['version'] != CHECKPOINT_VERSION:
+      raise ValueError("Checkpoint %s has version %s, expected %d." % (path, state['version'], CHECKPOINT_VERSION))
+    for p in self.values:
+      self.values[p] = array.array('d')
+      self.values[p].frombytes(state['values'][p])
+      if len(self.values[p]) != len(self.index):
+        raise ValueError("Checkpoint %s does not match the states being trained." % path)
+    self.eps = state['params']['eps']
+    self.lr0 = state['params']['lr']
+    self.lr_decay = state['params']['lr_decay']
+    self.lr_min = state['params']['lr_min']
+    self.episode = state['episode']
+    self.seconds = state['seconds']
+    self.curve = state['curve']
+    self.rng.setstate(state['random'])
+    self.opponent_random = state.get('opponent_random', self.opponent_random) # Missing from older checkpoints
+    self._last_values = self._flat_values()
+
+  def run(self, episodes, eval_every=10000, checkpoint=None, checkpoint_every=None, report=print):
+    '''Train until episodes episodes have been played in total, adding a point to the curve every eval_every episodes.
+If checkpoint is set, save to it every checkpoint_every episodes (at every point of the curve if None) and at the end.'''
+    if checkpoint_every == None: checkpoint_every = eval_every
+    if self.curve == []: self.evaluate()
+    while self.episode < episodes:
+      step = min(episodes, (self.episode // eval_every + 1) * eval_every) - self.episode
+      start = self.seconds
+      self.train(step)
+      episode, seconds, lr, optimal, change = self.evaluate()
+      if report != None:
+        report('%10d episodes, %8.0f episodes/s, lr %.4f, optimal moves %s, mean value change %.5f' % (
+               episode, step / max(seconds - start, 1e-9), lr,
+               '-' if optimal == None else '%.3f' % optimal, change))
+      if checkpoint != None and (self.episode % checkpoint_every == 0 or self.episode >= episodes):
+        self.save(checkpoint)
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Train RLPlayer offline.')
+  parser.add_argument('--episodes', type=int, default=1000000, help='total number of episodes to train for')
+  parser.add_argument('--opponent', default='self',
+                      help="'self' for self-play, or the name of a player class in ttt_player, e.g. DPlayer")
+  parser.add_argument('--eps', type=float, default=0.1, help='probability of an exploratory move')
+  parser.add_argument('--lr', type=float, default=0.5, help='initial learn rate')
+  parser.add_argument('--lr-decay', type=float, default=1e-5, help='the learn rate is lr / (1 + lr_decay * episode)')
+  parser.add_argument('--lr-min', type=float, default=0.01)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--eval-every', type=int, default=50000, help='episodes between points of the curve')
+  parser.add_argument('--checkpoint', help='file to save the training state to, and to resume from')
+  parser.add_argument('--checkpoint-every', type=int, help='episodes between checkpoints (default: eval-every)')
+  parser.add_argument('--resume', action='store_true', help='resume from the checkpoint, if it exists')
+  parser.add_argument('--curve', help='write the convergence curve to this file, as CSV')
+  args = parser.parse_args(argv[1:])
+
+  opponent = None if args.opponent == 'self' else getattr(ttt_player, args.opponent)
+  trainer = Trainer(eps=args.eps, lr=args.lr, lr_decay=args.lr_decay, lr_min=args.lr_min,
+                    opponent=opponent, seed=args.seed)
+  if args.resume and args.checkpoint != None and os.path.exists(args.checkpoint):
+    trainer.load(args.checkpoint)
+    print('Resuming from episode %d' % trainer.episode)
+  trainer.run(args.episodes, args.eval_every, args.checkpoint, args.checkpoint_every)
+  if args.curve != None:
+    with open(args.curve, 'w') as f:
+      f.write('episode,seconds,lr,optimal,change\n')
+      for point in trainer.curve:
+        f.write(','.join('' if x == None else str(x) for x in point) + '\n')
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
@@ -0,0 +1,77 @@
+'''Tables of board values, written by DRPlayer.save() and RLPlayer.save().
+
+A table holds one value per board configuration, indexed by the base-3 code of
+the board (see Board.encode()), so a lookup is a single offset computation on
+the memory-mapped file.
+
+File layout (little endian):
+  header: magic b'TTTV', format version (uint16), length n of the metadata (uint32)
+  metadata: n bytes of JSON, padded with spaces so that the values start at a multiple of 4 bytes:
+    the player class, its mark, the marks of the board, and the player's params
+  values: for every code in [0, 3**9), the value of the board with that code (float32), NaN if unknown
+'''
+
+__author__ ="Daniel S. Fava"
+__license__="License: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/"
+__year__   ="2018"
+
+import os
+import json
+import math
+import mmap
+import struct
+
+VERSION = 1
+MAGIC = b'TTTV'
+HEADER = struct.Struct('<4sHI')
+VALUE = struct.Struct('<f')
+NUM_VALUES = 3**9
+
+def write(path, meta, values):
+  '''Write the values, a dict code -> value, with meta, a dict of JSON-serializable metadata, to path.'''
+  meta = json.dumps(meta, sort_keys=True).encode()
+  meta += b' ' * (-(HEADER.size + len(meta)) % 4)
+  data = bytearray(HEADER.size + len(meta) + NUM_VALUES * VALUE.size)
+  HEADER.pack_into(data, 0, MAGIC, VERSION, len(meta))
+  data[HEADER.size:HEADER.size + len(meta)] = meta
+  offset = HEADER.size + len(meta)
+  for code in range(0, NUM_VALUES):
+    VALUE.pack_into(data, offset + code * VALUE.size, values.get(code, math.nan))
+  tmp = '%s.%d.tmp' % (path, os.getpid())
+  with open(tmp, 'wb') as f:
+    f.write(data)
+  os.replace(tmp, path)
+
+class ValueTable():
+
+  def __init__(self, data):
+    '''Wrap the content of a table file: bytes or a memory map.'''
+    if len(data) < HEADER.size: raise ValueError("Invalid table of values.")
+    magic, version, n = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or len(data) != HEADER.size + n + NUM_VALUES * VALUE.size:
+      raise ValueError("Invalid table of values.")
+    self.data = data
+    self.meta = json.loads(bytes(data[HEADER.size:HEADER.size + n]))
+    self.marks = (self.meta['e'], self.meta['p1'], self.meta['p2'])
+    self.offset = HEADER.size + n
+
+  def get(self, b):
+    '''Value of board b, None if the table has none.'''
+    if (b.e, b.p1, b.p2) != self.marks or (b.m, b.n, b.k) != (3, 3, 3): return None
+    v = VALUE.unpack_from(self.data, self.offset + b.encode() * VALUE.size)[0]
+    return None if v != v else v # NaN for unknown values
+
+  def items(self):
+    '''Iterate over the (code, value) pairs of the known values.'''
+    for code, (v,) in enumerate(VALUE.iter_unpack(self.data[self.offset:])):
+      if v == v: yield code, v
+
+def load(path):
+  '''Memory-map the table at path.  Raise ValueError if it is not a table of values.'''
+  with open(path, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    return ValueTable(data)
+  except ValueError:
+    data.close()
+    raise